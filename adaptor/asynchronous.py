@@ -0,0 +1,180 @@
+"""
+Import a csv stream from a coroutine, with the async ORM
+"""
+import codecs
+
+import django
+
+from adaptor.fields import ImportCaches, DjangoModelField
+
+
+class AsyncCsvImporter(object):
+    """
+    Import an async byte stream: an object with an async read(size), or an
+    async iterable of bytes. The stream is read by blocks and split in
+    records, chunk_size of them being parsed at once. The foreign keys of a
+    chunk are resolved, and its objects written with abulk_create, by the
+    async ORM; the event loop is never blocked by the database.
+    """
+    def __init__(self, csvModel, extra_fields=[], error_report=None, encoding="utf-8",
+                 chunk_size=1000, block_size=1 << 16):
+        from adaptor.model import CsvImporter, GroupedCsvModel, LinearLayout, ImproperlyConfigured
+        if django.VERSION < (4, 1):
+            raise ImproperlyConfigured("An async import needs Django 4.1 or later.")
+        self.csvModel = csvModel
+        self.importer = CsvImporter(csvModel=csvModel, extra_fields=extra_fields, error_report=error_report)
+        if issubclass(csvModel, GroupedCsvModel) or not isinstance(self.importer.layout, LinearLayout) \
+                or csvModel.has_update_method():
+            raise ImproperlyConfigured("An async import needs a LinearLayout, a non grouped model "
+                                       "and no update.")
+        self.error_report = error_report
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.block_size = block_size
+
+    async def import_stream(self, stream):
+        return [row async for row in self.iter_stream(stream)]
+
+    async def iter_stream(self, stream):
+        from adaptor.model import BulkWriter, CsvDataException
+        importer = self.importer
+        bulk_size = self.csvModel.bulk_size()
+        # The rows waiting for their objects to be written, and their writes
+        pending = []
+        pending_writes = 0
+        line_number = 0
+        async for records in self.read_records(stream):
+            lines = list(importer.get_reader(records))
+            # The foreign keys of a chunk are resolved in caches of the import,
+            # so that the other imports of the model neither see nor clear
+            # them, and renewed for each chunk, so that none is evicted
+            caches = ImportCaches(self.chunk_size)
+            await self.prefetch(records, lines, caches)
+            writer = BulkWriter(defer_all=True)
+            rows = []
+            try:
+                # No await until the chunk is processed: the caches are only
+                # active in this thread while it is
+                with caches:
+                    for line in lines:
+                        built = []
+                        raw_line = line[:] if self.error_report is not None else None
+                        try:
+                            with writer:
+                                importer.process_line(records, line, built, line_number, self.csvModel)
+                        except CsvDataException as e:
+                            if self.error_report is None:
+                                raise
+                            # The writes are recorded on the rows, dropped with them
+                            built = []
+                            self.error_report.add(e, raw_line, importer.delimiter)
+                        rows.extend(built)
+                        line_number += 1
+            except Exception:
+                # The lines before the failing one are kept, as in a sync import
+                await self.write(pending + rows)
+                raise
+            pending.extend(rows)
+            pending_writes += sum(len(row.__dict__.get("pending_writes", ())) for row in rows)
+            # As BulkWriter, write by batches of Meta.bulk_size
+            if bulk_size and pending_writes < bulk_size:
+                continue
+            await self.write(pending)
+            for row in pending:
+                yield row
+            pending = []
+            pending_writes = 0
+        await self.write(pending)
+        for row in pending:
+            yield row
+
+    async def read_blocks(self, stream):
+        if hasattr(stream, "read"):
+            while True:
+                block = await stream.read(self.block_size)
+                if not block:
+                    return
+                yield block
+        else:
+            async for block in stream:
+                yield block
+
+    async def read_blocks_text(self, stream):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        async for block in self.read_blocks(stream):
+            yield decoder.decode(block) if isinstance(block, bytes) else block
+        yield decoder.decode(b"", final=True)
+
+    async def read_records(self, stream):
+        """
+        Yield the records of the stream by lists of up to chunk_size. A
+        record ends on a newline outside of a quoted value. Without a
+        delimiter, the dialect is detected from the start of the stream
+        first, for its quotechar.
+        """
+        importer = self.importer
+        importer.get_class_delimiter()
+        sniff_size = self.csvModel.sniff_size()
+        quotechar = None
+        buffer = ""
+        scanned = 0
+        in_quote = False
+        records = []
+        blocks = self.read_blocks_text(stream)
+        while True:
+            try:
+                buffer += await blocks.__anext__()
+                end = False
+            except StopAsyncIteration:
+                end = True
+            if quotechar is None:
+                if not importer.delimiter:
+                    if len(buffer) < sniff_size and not end:
+                        continue
+                    if not buffer:
+                        return
+                    importer.get_dialect(buffer[:sniff_size])
+                quotechar = importer.dialect["quotechar"] if importer.dialect is not None else '"'
+            start = 0
+            while True:
+                newline = buffer.find("\n", scanned)
+                if newline == -1:
+                    break
+                if buffer.count(quotechar, scanned, newline) % 2:
+                    in_quote = not in_quote
+                scanned = newline + 1
+                if not in_quote:
+                    records.append(buffer[start:scanned])
+                    start = scanned
+            buffer = buffer[start:]
+            scanned -= start
+            while len(records) >= self.chunk_size:
+                yield records[:self.chunk_size]
+                records = records[self.chunk_size:]
+            if end:
+                break
+        if buffer:
+            records.append(buffer)
+        if records:
+            yield records
+
+    def get_foreign_entries(self):
+        return [entry for entry in self.csvModel.get_schema().entries
+                if isinstance(entry.field, DjangoModelField)]
+
+    async def prefetch(self, records, lines, caches):
+        for entry in self.get_foreign_entries():
+            values = self.importer.get_prefetch_values(records, lines, entry)
+            await entry.field.aprefetch_values(values, caches.get(entry.field))
+
+    async def write(self, rows):
+        groups = {}
+        for row in rows:
+            for model, values in row.__dict__.pop("pending_writes", []):
+                groups.setdefault(model, []).append((row, values))
+        for model, writes in groups.items():
+            objects = []
+            for row, values in writes:
+                row.object = model(**values)
+                objects.append(row.object)
+            await model.objects.abulk_create(objects, batch_size=self.csvModel.bulk_size() or None)
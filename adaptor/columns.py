@@ -0,0 +1,152 @@
+"""
+Import a csv file as typed columns instead of one object per line
+"""
+from array import array
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from adaptor.fields import IntegerField, FloatField, DecimalField, BooleanField, DateField,\
+    AllChoices, AlwaysValidValidator, identity
+from adaptor.validators import validate_many
+
+
+COLUMN_FIELDS = (IntegerField, FloatField, DecimalField, BooleanField, DateField)
+
+ARRAY_TYPES = [(IntegerField, 'q', 'int64', int),
+               (FloatField, 'd', 'float64', float),
+               (BooleanField, 'b', 'bool', bool)]
+
+
+class ColumnImporter(object):
+    """
+    Parse a csv file straight into one column per field.
+    Integer, float and boolean columns are NumPy arrays if NumPy is
+    installed, array.array otherwise. Decimal columns are lists, date columns
+    are datetime64 arrays with NumPy and lists otherwise. A column with values
+    which do not fit its type, like a null value without default, is a list.
+    """
+    def __init__(self, model, extra_fields=[]):
+        from adaptor.model import CsvImporter, ImproperlyConfigured
+        self.model = model
+        self.importer = CsvImporter(csvModel=model, extra_fields=extra_fields)
+        self.entries = []
+        for entry in model.get_schema().entries:
+            if entry.ignored:
+                continue
+            if not isinstance(entry.field, COLUMN_FIELDS) or entry.multiple:
+                raise ImproperlyConfigured("Field %s cannot be imported as a column. Only integer, float, "
+                                           "decimal, boolean and date fields can." % entry.name)
+            self.entries.append(entry)
+        # transform_<field_name> methods are called on an empty instance
+        self.instance = model.__new__(model)
+
+    def import_data(self, data):
+        from adaptor.model import CsvDataException
+        self.importer.get_class_delimiter()
+        values = [[] for entry in self.model.get_schema().entries]
+        line_numbers = []
+        for line_number, line in enumerate(self.importer.get_reader(data)):
+            if line_number == 0 and self.model.has_header():
+                continue
+            self.importer.process_extra_fields(data, line)
+            if len(line) < len(values):
+                raise CsvDataException(line_number, error="Number of fields invalid")
+            for column, value in zip(values, line):
+                column.append(value)
+            line_numbers.append(line_number)
+        return dict((entry.name, self.convert(entry, values[entry.column], line_numbers))
+                    for entry in self.entries)
+
+    def is_plain(self, entry):
+        field = entry.field
+        return (field.prepare is identity and field.transform is identity
+                and getattr(self.model, "transform_" + entry.name, None) is None)
+
+    def convert(self, entry, values, line_numbers):
+        from adaptor.model import CsvDataException
+        field = entry.field
+        # The null values get the default as it is, like without columns
+        if self.is_plain(entry) and not (field.null and "" in values):
+            try:
+                column = self.convert_plain(field, values)
+            except Exception:
+                # The values are converted one by one to find the invalid one
+                column = None
+            if column is not None:
+                # The choices and validators get the same python values as without columns
+                plain = column.tolist() if hasattr(column, "tolist") else column
+                if self.check_choices(entry, plain, values, line_numbers):
+                    self.validate(entry, plain, values, line_numbers)
+                    return column
+        column = []
+        for index, value in enumerate(values):
+            try:
+                column.append(field.get_prep_value(value, instance=self.instance))
+            except ValueError as e:
+                raise CsvDataException(line_numbers[index], field_error=str(e),
+                                       field_name=entry.name, value=value)
+        return self.pack(field, column)
+
+    def check_choices(self, entry, plain, values, line_numbers):
+        """
+        Raise on the first value out of the choices. A nullable field sets
+        such values to None: False is returned for them to be converted one
+        by one.
+        """
+        from adaptor.model import CsvDataException
+        field = entry.field
+        if isinstance(field.choices, AllChoices):
+            return True
+        for index, value in enumerate(plain):
+            if value not in field.choices:
+                if field.null:
+                    return False
+                raise CsvDataException(line_numbers[index], field_name=entry.name, value=values[index],
+                                       field_error="Value \'%s\' does not belong to %s" % (value, field.choices))
+        return True
+
+    def validate(self, entry, plain, values, line_numbers):
+        from adaptor.model import CsvDataException
+        field = entry.field
+        if field.validator is AlwaysValidValidator:
+            return
+        for index, valid in enumerate(validate_many(field.get_validator(), plain)):
+            if not valid:
+                raise CsvDataException(line_numbers[index], field_error=field.validator.validation_message,
+                                       field_name=entry.name, value=values[index])
+
+    def convert_plain(self, field, values):
+        if numpy is not None:
+            if isinstance(field, IntegerField):
+                return numpy.array(values).astype(numpy.int64)
+            if isinstance(field, FloatField):
+                return numpy.array(values).astype(numpy.float64)
+        if isinstance(field, IntegerField):
+            return array('q', map(int, values))
+        if isinstance(field, FloatField):
+            return array('d', map(float, values))
+        return self.pack(field, list(map(field.to_python, values)))
+
+    def pack(self, field, column):
+        if isinstance(field, DecimalField):
+            return column
+        if isinstance(field, DateField):
+            if numpy is not None and all(isinstance(value, datetime) for value in column):
+                return numpy.array(column, dtype="datetime64[us]")
+            return column
+        for field_class, typecode, dtype, python_type in ARRAY_TYPES:
+            if isinstance(field, field_class):
+                if any(type(value) is not python_type for value in column):
+                    return column
+                try:
+                    if numpy is not None:
+                        return numpy.array(column, dtype=dtype)
+                    return array(typecode, column)
+                except (OverflowError, TypeError, ValueError):
+                    # Like an integer beyond 64 bits
+                    return column
+        return column
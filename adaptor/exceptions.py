@@ -13,11 +13,18 @@ class ForeignKeyFieldError(FieldError):
         self.msg = msg
         super(ForeignKeyFieldError, self).__init__(self.msg)
 
+    def __reduce__(self):
+        return (self.__class__, (self.msg, self.model, self.value))
+
 
 class FieldValueMissing(FieldError):
     def __init__(self, field_name):
+        self.field_name = field_name
         super(FieldValueMissing, self).__init__("No value found for field %s" % field_name)
 
+    def __reduce__(self):
+        return (self.__class__, (self.field_name,))
+
 
 class ChoiceError(AdaptorError, ValueError):
     pass
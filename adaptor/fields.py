@@ -1,10 +1,28 @@
+import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
 from lxml import etree
 
-from django.db.models import Model as djangoModel
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.db.models import Model as djangoModel, Q
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
 from adaptor import exceptions
+from adaptor.instrumentation import timing
+from adaptor.validators import BaseValidator
+
+
+NO_MATCH = object()
+MULTIPLE_MATCH = object()
+
+# Composed keys OR'ed in a prefetch query, which SQLite limits in depth
+PREFETCH_OR_SIZE = 200
+
+SIMPLE_PATH = re.compile(r"^([A-Za-z_][\w.-]*:)?[A-Za-z_][\w.-]*(/([A-Za-z_][\w.-]*:)?[A-Za-z_][\w.-]*)*$")
+
+
+def identity(value):
+    return value
 
 
 class AllChoices(object):
@@ -12,14 +30,80 @@ class AllChoices(object):
         return True
 
 
-class AlwaysValidValidator(object):
+class LookupCache(object):
+    """
+    Keep the last `size` values used, dropping the least recently used first
+    """
+    def __init__(self, size):
+        self.size = size
+        self.values = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self.values[key]
+        except KeyError:
+            return default
+        self.values.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+
+    def clear(self):
+        self.values.clear()
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ImportCaches(object):
+    """
+    Foreign key caches owned by an import. While active in a thread, the
+    DjangoModelFields use them instead of their own caches, which are shared
+    by all the imports of their model.
+    """
+    _local = threading.local()
+
+    def __init__(self, size):
+        self.size = size
+        self.caches = {}
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, "caches", None)
+
+    def get(self, field):
+        cache = self.caches.get(field)
+        if cache is None:
+            cache = self.caches[field] = LookupCache(self.size)
+        return cache
+
+    def __enter__(self):
+        self.previous = ImportCaches.current()
+        ImportCaches._local.caches = self
+        return self
+
+    def __exit__(self, *exc_info):
+        ImportCaches._local.caches = self.previous
+
+
+class AlwaysValidValidator(BaseValidator):
     def validate(self, val):
         return True
 
+    def validate_many(self, values):
+        return [True] * len(values)
+
 
 class BaseField(object):
     def __init__(self, kwargs):
-        self.transform = kwargs.pop('transform', lambda val:val)
+        self.transform = kwargs.pop('transform', identity)
 
 
 class Field(BaseField):
@@ -39,9 +123,10 @@ class Field(BaseField):
         if 'match' in kwargs:
             self.match = kwargs.pop('match')
         self.validator = kwargs.pop('validator', AlwaysValidValidator)
+        self.validator_instance = None
         if 'multiple' in kwargs:
             self.has_multiple = kwargs.pop('multiple')
-        self.prepare = kwargs.pop('prepare', lambda val:val)
+        self.prepare = kwargs.pop('prepare', identity)
         if 'keys' in kwargs and isinstance(self, ComposedKeyField):
             self.keys = kwargs.pop('keys')
         self.choices= kwargs.pop('choices', AllChoices())
@@ -54,6 +139,15 @@ class Field(BaseField):
         transform = getattr(instance, transform_method, self.transform)
         return transform
 
+    def get_validator(self):
+        """
+        A single instance of the validator class is used for all the values
+        """
+        validator = self.validator_instance
+        if validator is None or validator[0] is not self.validator:
+            validator = self.validator_instance = (self.validator, self.validator())
+        return validator[1]
+
     def get_prep_value(self, value, instance=None):
         try:
             value = self.prepare(value)
@@ -67,7 +161,7 @@ class Field(BaseField):
                 value = None
             transform = self.get_transform_method(instance)
             value = transform(value)
-            if not self.validator().validate(value):
+            if not self.get_validator().validate(value):
                 raise exceptions.FieldError(self.validator.validation_message)
             return value
         except exceptions.ChoiceError:
@@ -113,6 +207,58 @@ class CharField(Field):
         return value
 
 
+DATE_DIRECTIVES = {'d': ('day', 2), 'm': ('month', 2), 'Y': ('year', 4),
+                   'H': ('hour', 2), 'M': ('minute', 2), 'S': ('second', 2)}
+
+
+def compile_date_format(format):
+    """
+    A parser for a format made only of fixed width numbers and separators,
+    like %d/%m/%Y or %Y-%m-%dT%H:%M:%S, None for the other formats.
+    The parser returns None for a value it cannot parse exactly, to let
+    strptime parse it or raise its own error.
+    """
+    numbers = []
+    separators = []
+    position = index = 0
+    while index < len(format):
+        char = format[index]
+        if char == '%':
+            directive = DATE_DIRECTIVES.get(format[index + 1:index + 2])
+            if directive is None or directive[0] in [name for name, start, end in numbers]:
+                return None
+            name, width = directive
+            numbers.append((name, position, position + width))
+            position += width
+            index += 2
+        else:
+            # strptime matches any run of spaces for a space
+            if char.isspace() or char.isdigit():
+                return None
+            separators.append((position, char))
+            position += 1
+            index += 1
+    length = position
+
+    def parse(value):
+        if len(value) != length:
+            return None
+        for position, char in separators:
+            if value[position] != char:
+                return None
+        values = {'year': 1900, 'month': 1, 'day': 1}
+        for name, start, end in numbers:
+            digits = value[start:end]
+            if not digits.isdigit():
+                return None
+            values[name] = int(digits)
+        try:
+            return datetime(**values)
+        except ValueError:
+            return None
+    return parse
+
+
 class DateField(Field):
     field_name = "Date"
 
@@ -121,10 +267,25 @@ class DateField(Field):
             self.format = kwargs.pop('format')
         else:
             self.format = "%d/%m/%Y"
+        self.parser = compile_date_format(self.format)
+        # The dates of a file often repeat, cache_size of them are kept
+        cache_size = kwargs.pop('cache_size', None)
+        self.cache = LookupCache(cache_size) if cache_size else None
         super(DateField, self).__init__(*args, **kwargs)
 
     def to_python(self, value):
-        return datetime.strptime(value, self.format)
+        if not isinstance(value, str):
+            return datetime.strptime(value, self.format)
+        if self.cache is not None:
+            date = self.cache.get(value)
+            if date is not None:
+                return date
+        date = self.parser(value) if self.parser is not None else None
+        if date is None:
+            date = datetime.strptime(value, self.format)
+        if self.cache is not None:
+            self.cache.set(value, date)
+        return date
 
 
 class DecimalField(Field):
@@ -150,6 +311,9 @@ class DjangoModelField(Field):
 
     def __init__(self, *args, **kwargs):
         self.pk = kwargs.pop('pk', 'pk')
+        self.prefetch = kwargs.pop('prefetch', None)
+        cache_size = kwargs.pop('cache_size', self.prefetch)
+        self.cache = LookupCache(cache_size) if cache_size else None
         if len(args) < 1:
             raise ValueError("You should provide a Model as the first argument.")
         self.model = args[0]
@@ -160,21 +324,254 @@ class DjangoModelField(Field):
             raise TypeError("The first argument should be a django model class.")
         super(DjangoModelField, self).__init__(**kwargs)
 
-    def to_python(self, value):
+    def find(self, value):
         try:
             return self.model.objects.get(**{self.pk: value})
         except ObjectDoesNotExist:
-            raise exceptions.ForeignKeyFieldError("No match found for %s" % self.model.__name__, self.model.__name__, value)
+            return NO_MATCH
         except MultipleObjectsReturned:
+            return MULTIPLE_MATCH
+
+    def get_cache_key(self, value):
+        return value
+
+    def to_python(self, value):
+        import_caches = ImportCaches.current()
+        cache = self.cache if import_caches is None else import_caches.get(self)
+        if cache is None:
+            with timing("lookup"):
+                object = self.find(value)
+        else:
+            key = self.get_cache_key(value)
+            object = cache.get(key)
+            if object is None:
+                with timing("lookup"):
+                    object = self.find(value)
+                cache.set(key, object)
+        if object is NO_MATCH:
+            raise exceptions.ForeignKeyFieldError("No match found for %s" % self.model.__name__, self.model.__name__, value)
+        if object is MULTIPLE_MATCH:
             raise exceptions.ForeignKeyFieldError("Multiple match found for %s" % self.model.__name__, self.model.__name__, value)
+        return object
+
+    async def afind(self, value):
+        try:
+            return await self.model.objects.aget(**{self.pk: value})
+        except ObjectDoesNotExist:
+            return NO_MATCH
+        except MultipleObjectsReturned:
+            return MULTIPLE_MATCH
+
+    def get_lookup_field(self):
+        if '__' in self.pk:
+            return None
+        if self.pk == 'pk':
+            return self.model._meta.pk
+        return self.model._meta.get_field(self.pk)
+
+    def get_prefetch_keys(self, lookup_field, values, cache):
+        """
+        The values not in cache, by the key the database returns them with
+        """
+        keys = {}
+        for value in values:
+            if value in cache:
+                continue
+            try:
+                keys.setdefault(lookup_field.to_python(value), []).append(value)
+            except ValidationError:
+                continue
+        return keys
+
+    def store_prefetched(self, keys, objects, cache):
+        for key, key_values in keys.items():
+            for value in key_values:
+                cache.set(value, objects.get(key, NO_MATCH))
+
+    def prefetch_values(self, values):
+        """
+        Resolve all the values not cached yet with a single query
+        """
+        lookup_field = self.get_lookup_field()
+        if self.cache is None or lookup_field is None:
+            return
+        keys = self.get_prefetch_keys(lookup_field, values, self.cache)
+        if not keys:
+            return
+        objects = {}
+        for object in self.model.objects.filter(**{self.pk + '__in': list(keys)}):
+            key = getattr(object, lookup_field.attname)
+            objects[key] = MULTIPLE_MATCH if key in objects else object
+        self.store_prefetched(keys, objects, cache=self.cache)
+
+    async def aprefetch_values(self, values, cache):
+        """
+        Resolve all the values not in cache with the async ORM, so that
+        to_python does not query the database. A value which cannot be a
+        key is cached as not matching.
+        """
+        lookup_field = self.get_lookup_field()
+        if lookup_field is None:
+            for value in set(values):
+                if value not in cache:
+                    cache.set(value, await self.afind(value))
+            return
+        for value in values:
+            try:
+                lookup_field.to_python(value)
+            except ValidationError:
+                cache.set(value, NO_MATCH)
+        keys = self.get_prefetch_keys(lookup_field, values, cache)
+        if not keys:
+            return
+        if lookup_field.unique:
+            objects = await self.model.objects.ain_bulk(list(keys), field_name=lookup_field.name)
+        else:
+            objects = {}
+            async for object in self.model.objects.filter(**{self.pk + '__in': list(keys)}):
+                key = getattr(object, lookup_field.attname)
+                objects[key] = MULTIPLE_MATCH if key in objects else object
+        self.store_prefetched(keys, objects, cache)
+
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
 
 
 class ComposedKeyField(DjangoModelField):
-    def to_python(self, value):
+    def find(self, value):
         try:
             return self.model.objects.get(**value)
         except ObjectDoesNotExist:
-            raise exceptions.ForeignKeyFieldError("No match found for %s" % self.model.__name__, self.model.__name__, value)
+            return NO_MATCH
+
+    def get_cache_key(self, value):
+        return tuple(sorted(value.items()))
+
+    async def afind(self, value):
+        try:
+            return await self.model.objects.aget(**value)
+        except ObjectDoesNotExist:
+            return NO_MATCH
+
+    def get_key_fields(self):
+        """
+        The model fields of the keys, None if a key is a lookup across models
+        """
+        if any('__' in key for key in self.keys):
+            return None
+        return [(key, self.model._meta.pk if key == 'pk' else self.model._meta.get_field(key))
+                for key in self.keys]
+
+    def get_prefetch_keys(self, key_fields, values, cache):
+        """
+        The values not in cache, by the key the database returns them with:
+        their values given to the model fields, as for a single key. The
+        values which cannot be keys are left to find.
+        """
+        keys = {}
+        for value in values:
+            cache_key = self.get_cache_key(value)
+            if cache_key in cache:
+                continue
+            try:
+                key = tuple(sorted((name, field.to_python(value[name])) for name, field in key_fields))
+            except ValidationError:
+                continue
+            keys.setdefault(key, (value, []))[1].append(cache_key)
+        return keys
+
+    def get_prefetch_queries(self, keys):
+        """
+        The queries fetching the keys by PREFETCH_OR_SIZE
+        """
+        queries = []
+        key_values = [value for value, cache_keys in keys.values()]
+        for start in range(0, len(key_values), PREFETCH_OR_SIZE):
+            query = Q(**key_values[start])
+            for value in key_values[start + 1:start + PREFETCH_OR_SIZE]:
+                query |= Q(**value)
+            queries.append(query)
+        return queries
+
+    def get_object_key(self, key_fields, object):
+        return tuple(sorted((name, getattr(object, field.attname)) for name, field in key_fields))
+
+    def store_prefetched(self, keys, objects, cache):
+        for key, (value, cache_keys) in keys.items():
+            object = objects.get(key, NO_MATCH)
+            # Let get() raise as usual on duplicated keys
+            if object is not MULTIPLE_MATCH:
+                for cache_key in cache_keys:
+                    cache.set(cache_key, object)
+
+    def prefetch_values(self, values):
+        """
+        Resolve all the distinct keys not cached yet with a few OR'ed queries
+        """
+        key_fields = self.get_key_fields()
+        if self.cache is None or key_fields is None:
+            return
+        keys = self.get_prefetch_keys(key_fields, values, self.cache)
+        if not keys:
+            return
+        objects = {}
+        for query in self.get_prefetch_queries(keys):
+            for object in self.model.objects.filter(query):
+                key = self.get_object_key(key_fields, object)
+                objects[key] = MULTIPLE_MATCH if key in objects else object
+        self.store_prefetched(keys, objects, self.cache)
+
+    async def aprefetch_values(self, values, cache):
+        key_fields = self.get_key_fields()
+        keys = self.get_prefetch_keys(key_fields, values, cache) if key_fields is not None else {}
+        objects = {}
+        for query in self.get_prefetch_queries(keys):
+            async for object in self.model.objects.filter(query):
+                key = self.get_object_key(key_fields, object)
+                objects[key] = MULTIPLE_MATCH if key in objects else object
+        self.store_prefetched(keys, objects, cache)
+        # The duplicated keys, and the keys across models, are resolved one by
+        # one, for aget to raise as get does. A value which cannot be a key is
+        # cached as not matching.
+        for value in values:
+            cache_key = self.get_cache_key(value)
+            if cache_key in cache:
+                continue
+            try:
+                object = await self.afind(value)
+            except (ValueError, ValidationError):
+                object = NO_MATCH
+            cache.set(cache_key, object)
+
+
+class DocumentCache(object):
+    """
+    While active, each document is parsed once: all the fields of a model,
+    and of its embedded models, share the same tree.
+    """
+    _local = threading.local()
+
+    def __enter__(self):
+        self.nested = getattr(DocumentCache._local, "documents", None) is not None
+        if not self.nested:
+            DocumentCache._local.documents = {}
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.nested:
+            DocumentCache._local.documents = None
+
+
+def parse_document(value):
+    documents = getattr(DocumentCache._local, "documents", None)
+    if documents is None:
+        return etree.fromstring(value)
+    # The document is kept with its tree so its id cannot be reused
+    document = documents.get(id(value))
+    if document is None or document[0] is not value:
+        document = documents[id(value)] = (value, etree.fromstring(value))
+    return document[1]
 
 
 class XMLField(Field):
@@ -185,6 +582,11 @@ class XMLField(Field):
         self.root = kwargs.pop("root", None)
         self.attribute = kwargs.pop("attribute", None)
         self.namespaces = kwargs.pop("namespaces", None)
+        # Simple child paths are looked up with find, the others compiled once
+        if SIMPLE_PATH.match(self.path):
+            self.xpath = None
+        else:
+            self.xpath = etree.XPath(self.path, namespaces=self.namespaces)
         self.type_class = self._get_type_field()
         if self.type_class:
             self.type_class.__init__(self, *args, **kwargs)
@@ -197,23 +599,32 @@ class XMLField(Field):
             if issubclass(base_class, Field) and not issubclass(base_class, XMLField):
                 return base_class
 
+    def find_elements(self, element):
+        if self.xpath is not None:
+            return self.xpath(element)
+        return element.findall(self.path, namespaces=self.namespaces)
+
+    def find_element(self, element):
+        if self.xpath is not None:
+            values = self.xpath(element)
+            return values[0] if values else None
+        return element.find(self.path, namespaces=self.namespaces)
+
     def get_prep_value(self, value, instance=None):
-        from lxml import etree
-        element = self.root if self.root is not None else etree.fromstring(value)
-        values = element.xpath(self.path, namespaces=self.namespaces)
-        if not values and self.null:
+        element = self.root if self.root is not None else parse_document(value)
+        found = self.find_element(element)
+        if found is None and self.null:
             if self.default is not None:
                 parsed_value = self.default
             else:
                 return None
         else:
+            if found is None:
+                raise IndexError(self.path)
             if not self.attribute:
-                parsed_value = element.xpath(self.path,
-                                             namespaces=self.namespaces)[0].text
+                parsed_value = found.text
             else:
-                parsed_value = element.xpath(self.path,
-                                             namespaces=self.namespaces)[0]\
-                                      .get(self.attribute)
+                parsed_value = found.get(self.attribute)
         return self.type_class.get_prep_value(self, parsed_value, instance=instance)
 
     def set_root(self, root):
@@ -236,9 +647,8 @@ class XMLRootField(XMLField):
         pass
 
     def get_root(self, value):
-        from lxml import etree
-        element = self.root if self.root is not None else etree.fromstring(value)
-        return element.xpath(self.path, namespaces=self.namespaces)
+        element = self.root if self.root is not None else parse_document(value)
+        return self.find_elements(element)
 
 
 class XMLEmbed(XMLRootField):
@@ -248,8 +658,11 @@ class XMLEmbed(XMLRootField):
         self.embed_model = embed_model
         super(XMLEmbed, self).__init__(path=self.embed_model.get_root_field()[1].path)
 
+    def clear_cache(self):
+        self.embed_model.clear_caches()
+
     def get_prep_value(self, value, instance=None):
-        roots = self.get_root(self.root)
+        roots = self.get_root(value)
         objects = []
         for root in roots:
             objects.append(self.embed_model(value, element=root))
@@ -0,0 +1,208 @@
+"""
+Follow the progress of an import and where its time goes
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+STAGES = ("parse", "convert", "lookup", "write")
+
+
+class Progress(object):
+    """
+    State of an instrumented import, given to its instrument.
+    The time is split between the STAGES: a stage entered inside another
+    one pauses it, so the timings add up to the time spent importing.
+    """
+    _local = threading.local()
+
+    def __init__(self, instrument):
+        self.instrument = instrument
+        self.rows = 0
+        # Size of the input read: characters, or bytes for a binary input
+        self.characters = 0
+        self.errors = 0
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.stages = []
+        self.mark = None
+        self.next_batch = instrument.every
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, "progress", None)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_sec(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed else 0.0
+
+    @contextmanager
+    def stage(self, name):
+        previous = Progress.current()
+        Progress._local.progress = self
+        now = time.perf_counter()
+        if self.stages:
+            self.timings[self.stages[-1]] += now - self.mark
+        self.stages.append(name)
+        self.mark = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.timings[self.stages.pop()] += now - self.mark
+            self.mark = now
+            Progress._local.progress = previous
+
+    def timed(self, name, iterator):
+        """
+        Iterate, counting the time spent in the iterator in the stage name
+        """
+        iterator = iter(iterator)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def counted(self, data):
+        for line in data:
+            self.characters += len(line)
+            yield line
+
+    def counted_file(self, file):
+        return CountedFile(file, self)
+
+    def add_rows(self, count=1):
+        self.rows += count
+        if self.rows >= self.next_batch:
+            self.next_batch = self.rows + self.instrument.every
+            self.instrument.batch(self)
+
+    def add_error(self):
+        self.errors += 1
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        self.instrument.finish(self)
+
+
+class CountedFile(object):
+    """
+    Count the characters, or bytes, read from a file in the progress of an
+    import
+    """
+    def __init__(self, file, progress):
+        self.file = file
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.progress.characters += len(data)
+        return data
+
+
+@contextmanager
+def timing(name):
+    """
+    Count the time spent in the block in the stage name of the current
+    import, if it is instrumented
+    """
+    progress = Progress.current()
+    if progress is None:
+        yield
+        return
+    with progress.stage(name):
+        yield
+
+
+class Instrument(object):
+    """
+    Base of the instruments given to an import with instrument=.
+    batch is called every `every` rows, finish at the end of the import.
+    """
+    def __init__(self, every=10000):
+        self.every = every
+
+    def start(self):
+        return Progress(self)
+
+    def batch(self, progress):
+        pass
+
+    def finish(self, progress):
+        pass
+
+
+class LoggingInstrument(Instrument):
+    """
+    Log the progress every `every` rows, and the time spent in each stage
+    at the end of the import
+    """
+    def __init__(self, every=10000, logger=None, level=logging.INFO):
+        super(LoggingInstrument, self).__init__(every)
+        self.logger = logger or logging.getLogger("adaptor")
+        self.level = level
+
+    def batch(self, progress):
+        self.logger.log(self.level, "%d rows imported, %d characters read, %.0f rows/sec, %d errors",
+                        progress.rows, progress.characters, progress.rows_per_sec, progress.errors)
+
+    def finish(self, progress):
+        self.logger.log(self.level, "Import done: %d rows in %.2fs, %.0f rows/sec, %d errors (%s)",
+                        progress.rows, progress.elapsed, progress.rows_per_sec, progress.errors,
+                        ", ".join("%s %.2fs" % (stage, progress.timings[stage]) for stage in STAGES))
+
+
+class HistogramInstrument(Instrument):
+    """
+    Collect the throughput of each batch of `every` rows and the time spent
+    in each stage, for a report once the import is done.
+    The throughputs are counted in power of two buckets of rows/sec.
+    """
+    def __init__(self, every=1000):
+        super(HistogramInstrument, self).__init__(every)
+        self.progress = None
+
+    def start(self):
+        self.histogram = {}
+        self.batches = []
+        self.last = (0, 0.0)
+        return super(HistogramInstrument, self).start()
+
+    def batch(self, progress):
+        rows, elapsed = progress.rows - self.last[0], progress.elapsed - self.last[1]
+        self.last = (progress.rows, progress.elapsed)
+        if not rows or not elapsed:
+            return
+        rows_per_sec = rows / elapsed
+        self.batches.append(rows_per_sec)
+        bucket = 1 << max(int(rows_per_sec).bit_length() - 1, 0)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def finish(self, progress):
+        self.batch(progress)
+        self.progress = progress
+
+    def report(self):
+        progress = self.progress
+        if progress is None:
+            return "No import done"
+        lines = ["%d rows in %.2fs, %.0f rows/sec, %d errors" % (progress.rows, progress.elapsed,
+                                                               progress.rows_per_sec, progress.errors)]
+        for stage in STAGES:
+            share = progress.timings[stage] / progress.elapsed if progress.elapsed else 0
+            lines.append("%-8s %8.3fs %5.1f%%" % (stage, progress.timings[stage], share * 100))
+        lines.append("rows/sec     batches")
+        for bucket in sorted(self.histogram):
+            lines.append(">= %-9d %d" % (bucket, self.histogram[bucket]))
+        return "\n".join(lines)
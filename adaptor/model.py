@@ -1,12 +1,52 @@
 """
 Define the csv model base classe
 """
+import collections
+import contextlib
 import copy
+import io
+import re
+import locale
+import multiprocessing
+import operator
+import queue
+import threading
+from functools import reduce
+from itertools import islice
 
 import csv
+from django.db import connections, transaction
+from django.db.models import Q
 from django.db.models.base import Model
-from adaptor.fields import Field, IgnoredField, ComposedKeyField, XMLRootField
+from adaptor.fields import Field, IgnoredField, DateField, ComposedKeyField, XMLField, XMLRootField, XMLEmbed,\
+    DocumentCache
 from adaptor.exceptions import ForeignKeyFieldError, FieldValueMissing
+from adaptor.readers import split_records, MappedFile, SNIFF_SIZE, sniff_dialect, read_sample,\
+    get_compression, open_compressed
+from adaptor.columns import ColumnImporter
+from adaptor.asynchronous import AsyncCsvImporter
+from adaptor.instrumentation import timing
+
+
+PARALLEL_XML_CHUNK = 100
+
+# Lines per chunk, and chunks per queue, of a pipelined import
+PIPELINE_CHUNK = 100
+PIPELINE_QUEUE = 4
+
+# Keys looked up per query by an update with bulk_size: values of a single
+# key in an __in, or composed keys in an OR, which SQLite limits in depth
+UPSERT_IN_SIZE = 500
+UPSERT_OR_SIZE = 200
+
+# (model, feed) -> the dialect detected for the files of the feed
+_dialects = {}
+
+STREAM_STEP = re.compile(r"^(\*|([A-Za-z_][\w.-]*:)?[A-Za-z_][\w.-]*)$")
+# The paths leaving the root element: absolute, to a parent or an ancestor,
+# or along the siblings
+OUTER_PATH = re.compile(r"^\s*/|(^|[/\[(|,\s])\.\.|\b(ancestor|ancestor-or-self|parent|preceding|"
+                        r"preceding-sibling|following|following-sibling)::")
 
 
 class ImproperlyConfigured(Exception):
@@ -25,35 +65,354 @@ class CsvDataException(CsvException):
     """
     Raised if a data does not match the expectations
     """
-    def __init__(self, line, error=None, field_error=None):
+    def __init__(self, line, error=None, field_error=None, field_name=None, value=None):
         self.line = line + 1
         self.error = error
         self.field_error = field_error
+        self.field_name = field_name
+        self.value = value
         err_msg = self.error if self.error else self.field_error
         super(CsvDataException, self).__init__(u"Line %d: %s" % (self.line, err_msg))
 
+    def __reduce__(self):
+        return (self.__class__, (self.line - 1, self.error, self.field_error, self.field_name, self.value))
+
 
 class CsvFieldDataException(CsvDataException):
-    def __init__(self, line, field_error, model, value):
+    def __init__(self, line, field_error, model, value, field_name=None):
         self.model = model
-        self.value = value
-        super(CsvFieldDataException, self).__init__(line, field_error=field_error)
+        super(CsvFieldDataException, self).__init__(line, field_error=field_error,
+                                                    field_name=field_name, value=value)
+
+    def __reduce__(self):
+        return (self.__class__, (self.line - 1, self.field_error, self.model, self.value, self.field_name))
 
 
 class SkipRow(Exception):
     pass
 
 
-class BaseModel(object):
+class BulkWriter(object):
+    """
+    Buffer the objects created by the rows of an import and write them with
+    bulk_create once Meta.bulk_size of them are pending. Rows are released
+    in order, once their object has been written.
+    """
+    _local = threading.local()
+
+    def __init__(self, defer_all=False):
+        # If defer_all, the writes of every row are only recorded on the row,
+        # to be replayed by another writer
+        self.defer_all = defer_all
+        self.batch_size = None
+        self.pending = []
+        self.rows = []
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, "writer", None)
+
+    def __enter__(self):
+        self.previous = BulkWriter.current()
+        BulkWriter._local.writer = self
+        return self
+
+    def __exit__(self, *exc_info):
+        BulkWriter._local.writer = self.previous
+
+    def defers(self, row):
+        return self.defer_all or row.cls.bulk_size()
+
+    def add(self, row, model, values):
+        if self.defer_all:
+            row.__dict__.setdefault("pending_writes", []).append((model, values))
+            return
+        self.batch_size = row.cls.bulk_size()
+        self.pending.append((row, model, values))
+
+    def mark(self):
+        return len(self.pending)
+
+    def discard(self, mark):
+        """
+        Drop the writes added since mark, like those of a rejected line
+        """
+        del self.pending[mark:]
+
+    def replay(self, row):
+        for model, values in row.__dict__.pop("pending_writes", []):
+            row.base_create_model(model, **values)
+
+    def push(self, rows):
+        self.rows.extend(rows)
+        if self.pending and len(self.pending) < self.batch_size:
+            return []
+        return self.flush()
+
+    def flush(self):
+        self.write()
+        rows, self.rows = self.rows, []
+        return rows
+
+    def write(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        groups = {}
+        for row, model, values in pending:
+            groups.setdefault((row.cls, model), []).append((row, values))
+        with transaction.atomic():
+            for (cls, model), rows in groups.items():
+                if cls.has_update_method():
+                    self.upsert(cls.Meta.update, model, rows)
+                else:
+                    self.create(model, rows)
+
+    def create(self, model, rows):
+        objects = []
+        for row, values in rows:
+            row.object = model(**values)
+            objects.append(row.object)
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def upsert(self, update_dict, model, rows):
+        """
+        Fetch the existing objects of all the rows with a few queries, then
+        bulk_create the new ones and bulk_update the others.
+        """
+        try:
+            keys = update_dict['keys']
+        except KeyError:
+            raise ImproperlyConfigured("The update dict should contains a keys value")
+        key_fields = [model._meta.get_field(key) for key in keys]
+
+        def get_key(values):
+            return tuple(field.to_python(values[field.name].pk if isinstance(values[field.name], Model)
+                                         else values[field.name])
+                         for field in key_fields)
+
+        lookups = dict((get_key(values), dict((key, values[key]) for key in keys)) for row, values in rows)
+        existing = {}
+        for object in self.get_existing(model, keys, list(lookups.values())):
+            key = tuple(getattr(object, field.attname) for field in key_fields)
+            if key in existing:
+                raise ImproperlyConfigured(
+                    "Multiple values returned for the update key %s.\
+                                        Keys provide are not unique" % dict(zip(keys, key)))
+            existing[key] = object
+
+        created = []
+        updated = {}
+        update_fields = set(update_dict.get('update', []))
+        for row, values in rows:
+            key = get_key(values)
+            object = existing.get(key)
+            if object is None:
+                object = existing[key] = model(**values)
+                created.append(object)
+            else:
+                new_values = values
+                if 'update' in update_dict:
+                    new_values = dict((field_name, values[field_name]) for field_name in update_dict['update'])
+                else:
+                    update_fields.update(values)
+                for field_name in new_values:
+                    setattr(object, field_name, new_values[field_name])
+                if object.pk is not None:
+                    updated[object.pk] = object
+            row.object = object
+        model.objects.bulk_create(created, batch_size=self.batch_size)
+        if updated:
+            model.objects.bulk_update(list(updated.values()), list(update_fields), batch_size=self.batch_size)
+
+    def get_existing(self, model, keys, lookups):
+        """
+        The objects matching the lookups, by bounded queries. A None key
+        matches NULL, as it does with get(): an equality does, not an in.
+        """
+        if len(keys) == 1:
+            key = keys[0]
+            values = [lookup[key] for lookup in lookups if lookup[key] is not None]
+            for start in range(0, len(values), UPSERT_IN_SIZE):
+                for object in model.objects.filter(**{key + '__in': values[start:start + UPSERT_IN_SIZE]}):
+                    yield object
+            if len(values) < len(lookups):
+                for object in model.objects.filter(**{key + '__isnull': True}):
+                    yield object
+            return
+        for start in range(0, len(lookups), UPSERT_OR_SIZE):
+            query = reduce(operator.or_, (Q(**lookup) for lookup in lookups[start:start + UPSERT_OR_SIZE]))
+            for object in model.objects.filter(query):
+                yield object
+
+
+class SchemaEntry(object):
+    """
+    A field of a model with everything needed to process a row resolved
+    """
+    def __init__(self, name, field, position, column):
+        self.name = name
+        self.field = field
+        self.position = position
+        self.column = column
+        # If match attribute is defined, use the match name,
+        # else use the field name
+        self.match = field.__dict__.get("match", name)
+        self.multiple = getattr(field, "has_multiple", False)
+        self.composed = isinstance(field, ComposedKeyField)
+        self.ignored = isinstance(field, IgnoredField)
+        self.convert = field.get_prep_value
+
+
+class FieldSchema(object):
+    """
+    Fields of a model compiled once per class and shared by all its rows
+    """
+    def __init__(self, fields):
+        self.fields = fields
+        # The Meta options the fields were compiled with
+        self.meta_version = MetaOptions.version
+        self.entries = []
+        self.multiple_index = 0
+        self.multiple_fieldname = None
+        self.prefetched = []
+        self.prefetch_size = None
+        column = 0
+        for position, (fieldname, field) in enumerate(fields):
+            if isinstance(field, Field):
+                field.position = position
+            entry = SchemaEntry(fieldname, field, position, column)
+            if entry.composed:
+                entry.column = None
+            else:
+                column += 1
+            if entry.multiple and not self.multiple_fieldname:
+                self.multiple_index = position
+                self.multiple_fieldname = fieldname
+            prefetch = getattr(field, "prefetch", None)
+            if prefetch and not entry.multiple:
+                self.prefetched.append(entry)
+                self.prefetch_size = min(prefetch, self.prefetch_size or prefetch)
+            self.entries.append(entry)
+        self.matches = dict((entry.match, entry) for entry in self.entries
+                            if not isinstance(entry.match, list))
+        # Generated on demand by BaseModel.get_record_class
+        self.record_class = None
+
+
+class Record(object):
+    """
+    Compact row of a model: only the values of its fields, held in slots.
+    A subclass is generated for each model.
+    """
+    __slots__ = ()
+    _fields = ()
+    _embedded = frozenset()
+    _model = None
+
+    def __init__(self, *values):
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    def export(self, delimiter=None):
+        """
+        The values as a csv line, quoted as needed. None, as for an unset
+        field, is exported empty.
+        """
+        if delimiter is None:
+            delimiter = self._model.Meta.delimiter if self._model.has_class_delimiter() else ","
+        line = io.StringIO()
+        writer = csv.writer(line, delimiter=delimiter, lineterminator="")
+        writer.writerow(["" if value is None else str(value)
+                         for value in (getattr(self, name) for name in self._fields)])
+        return line.getvalue()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ", ".join("%s=%r" % (name, getattr(self, name)) for name in self._fields))
+
+
+class MetaOptions(type):
+    """
+    The Meta classes of the models are made of this type, so that setting
+    or deleting one of their options, like dbModel or exclude, drops the
+    compiled schemas.
+    """
+    version = 0
+
+    def __setattr__(meta, name, value):
+        super(MetaOptions, meta).__setattr__(name, value)
+        MetaOptions.version += 1
+
+    def __delattr__(meta, name):
+        super(MetaOptions, meta).__delattr__(name)
+        MetaOptions.version += 1
+
+    @staticmethod
+    def wrap(meta):
+        # Other metaclasses, and options which are not classes, are left as is
+        if type(meta) is not type:
+            return meta
+        # Rebuilt rather than subclassed, for a deleted option not to show the original one
+        attrs = dict((name, value) for name, value in vars(meta).items()
+                     if name not in ("__dict__", "__weakref__"))
+        return MetaOptions(meta.__name__, meta.__bases__, attrs)
+
+
+class ModelMetaclass(type):
+    """
+    Drop the compiled schema of a model, and of its subclasses, as soon as
+    one of its attributes, or of its Meta options, changes.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(ModelMetaclass, cls).__init__(name, bases, attrs)
+        if "Meta" in attrs:
+            type.__setattr__(cls, "Meta", MetaOptions.wrap(attrs["Meta"]))
+
+    def __setattr__(cls, name, value):
+        if name == "Meta":
+            value = MetaOptions.wrap(value)
+        super(ModelMetaclass, cls).__setattr__(name, value)
+        if name != "_schema":
+            cls.invalidate_schema()
+
+    def __delattr__(cls, name):
+        super(ModelMetaclass, cls).__delattr__(name)
+        if name != "_schema":
+            cls.invalidate_schema()
+
+
+class BaseModel(object, metaclass=ModelMetaclass):
     def __init__(self, data, delimiter=None):
         self.cls = self.__class__
-        self.attrs = self.get_fields()
+        self.attrs = self.get_schema().fields
         self.errors = []
         self.dont_raise_exception = hasattr(self.cls, "Meta") and hasattr(self.cls.Meta, "raise_exception") and not self.cls.Meta.raise_exception
 
     def is_valid(self):
         return len(self.errors) == 0
 
+    def __getstate__(self):
+        # The fields are not picklable, they are taken back from the schema
+        state = self.__dict__.copy()
+        state.pop("attrs", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attrs = self.cls.get_schema().fields
+
     @classmethod
     def get_fields(cls):
         all_cls_dict = {}
@@ -72,17 +431,69 @@ class BaseModel(object):
         sorted_field = sorted(attributes, key=lambda attrs: attrs[1].position)
         return sorted_field
 
+    @classmethod
+    def get_schema(cls):
+        schema = cls.__dict__.get("_schema")
+        if schema is None or schema.meta_version != MetaOptions.version:
+            schema = FieldSchema(cls.get_fields())
+            cls._schema = schema
+        return schema
+
+    @classmethod
+    def invalidate_schema(cls):
+        if "_schema" in cls.__dict__:
+            del cls._schema
+        for subclass in cls.__subclasses__():
+            subclass.invalidate_schema()
+
+    @classmethod
+    def clear_caches(cls):
+        for entry in cls.get_schema().entries:
+            if hasattr(entry.field, "clear_cache"):
+                entry.field.clear_cache()
+
     @classmethod
     def get_data_fields(cls):
-       return [fieldname for (fieldname, field) in cls.get_fields() if fieldname not in getattr(cls, "_exclude_data_fields", [])]
+       return [entry.name for entry in cls.get_schema().entries if entry.name not in getattr(cls, "_exclude_data_fields", [])]
 
     def as_dict(self):
        return dict((field, getattr(self, field)) for field in self.get_data_fields())
 
+    @classmethod
+    def get_record_class(cls):
+        schema = cls.get_schema()
+        if schema.record_class is None:
+            fields = tuple(cls.get_data_fields())
+            embedded = frozenset(entry.name for entry in schema.entries if isinstance(entry.field, XMLEmbed))
+            schema.record_class = type(cls.__name__ + "Record", (Record,),
+                                       {"__slots__": fields, "_fields": fields, "_embedded": embedded,
+                                        "_model": cls})
+        return schema.record_class
+
+    def as_record(self):
+        """
+        The values of the fields, without the state of the import.
+        Embedded models are turned into records as well.
+        """
+        record_class = self.get_record_class()
+        values = []
+        for name in record_class._fields:
+            # An ignored or unset field is None, not the field of the class
+            value = self.__dict__.get(name)
+            # An optional embedded value may be None, or a single object once transformed
+            if name in record_class._embedded and value is not None:
+                if isinstance(value, BaseModel):
+                    value = value.as_record()
+                else:
+                    value = [embedded.as_record() for embedded in value]
+            values.append(value)
+        return record_class(*values)
+
     def get_value(self, attr_name, field, value):
-        self.__dict__[attr_name] = field.get_prep_value(value)
+        value = field.get_prep_value(value)
+        self.__dict__[attr_name] = value
         self.field_matching_name = field.__dict__.get("match", attr_name)
-        return field.get_prep_value(value)
+        return value
 
     def update_object(self, dict_values, object, update_dict):
         new_dict_values = {}
@@ -98,31 +509,36 @@ class BaseModel(object):
         object.save()
 
     def base_create_model(self, model, **dict_values):
-        object = None
-        if self.cls.has_update_method():
-            keys = None
-            update_dict = self.cls.Meta.update
-            try:
-                keys = update_dict['keys']
-            except KeyError:
-                raise ImproperlyConfigured("The update dict should contains a keys value")
-            filter_values = {}
-            for key in keys:
-                filter_values.update({key: dict_values[key]})
+        writer = BulkWriter.current()
+        if writer is not None and writer.defers(self):
+            writer.add(self, model, dict_values)
+            return
+        with timing("write"):
             object = None
-            try:
-                object = model.objects.get(**filter_values)
-            except model.DoesNotExist:
-                object = model.objects.create(**dict_values)
-            except model.MultipleObjectsReturned:
-                raise ImproperlyConfigured(
-                    "Multiple values returned for the update key %s.\
+            if self.cls.has_update_method():
+                keys = None
+                update_dict = self.cls.Meta.update
+                try:
+                    keys = update_dict['keys']
+                except KeyError:
+                    raise ImproperlyConfigured("The update dict should contains a keys value")
+                filter_values = {}
+                for key in keys:
+                    filter_values.update({key: dict_values[key]})
+                object = None
+                try:
+                    object = model.objects.get(**filter_values)
+                except model.DoesNotExist:
+                    object = model.objects.create(**dict_values)
+                except model.MultipleObjectsReturned:
+                    raise ImproperlyConfigured(
+                        "Multiple values returned for the update key %s.\
                                         Keys provide are not unique" % filter_values)
+                else:
+                    self.update_object(dict_values, object, update_dict)
             else:
-                self.update_object(dict_values, object, update_dict)
-        else:
-            object = model.objects.create(**dict_values)
-        self.object = object
+                object = model.objects.create(**dict_values)
+            self.object = object
 
     def get_object(self):
         if self.cls.is_db_model():
@@ -150,21 +566,15 @@ class BaseModel(object):
             values_dict[fields_name] = values
 
     def construct_obj_from_model(self, object):
-        for field_name, field in self.get_fields():
-            setattr(self,
-                    field_name,
-                    getattr(object,
-                            # If match attribute is defined, use the match name,
-                            # else use the field name
-                            field.__dict__.get("match", field_name), None))
+        for entry in self.cls.get_schema().entries:
+            setattr(self, entry.name, getattr(object, entry.match, None))
         return self
 
     def export(self):
-        line = u""
-        for field_name, field in self.get_fields():
-            line += str(getattr(self, field_name))
-            line += self.delimiter
-        return line.rstrip(self.delimiter) # remove the extra delimiter
+        line = io.StringIO()
+        writer = csv.writer(line, delimiter=self.delimiter, lineterminator="")
+        writer.writerow([str(getattr(self, entry.name)) for entry in self.cls.get_schema().entries])
+        return line.getvalue()
 
     @classmethod
     def is_db_model(cls):
@@ -185,6 +595,18 @@ class BaseModel(object):
             raise ImproperlyConfigured("You should define a model when using the update option")
         return has_update
 
+    @classmethod
+    def sniff_size(cls):
+        if not hasattr(cls, "Meta") or not hasattr(cls.Meta, "sniff_size"):
+            return SNIFF_SIZE
+        return cls.Meta.sniff_size
+
+    @classmethod
+    def bulk_size(cls):
+        if not hasattr(cls, "Meta") or not hasattr(cls.Meta, "bulk_size"):
+            return None
+        return cls.Meta.bulk_size
+
     @classmethod
     def silent_failure(cls):
         if not hasattr(cls, "Meta") or not hasattr(cls.Meta, "silent_failure"):
@@ -192,20 +614,51 @@ class BaseModel(object):
         return cls.Meta.silent_failure
 
     @classmethod
-    def import_data(cls, data, extra_fields=[]):
-        importer = cls.get_importer(extra_fields)
+    def import_data(cls, data, extra_fields=[], **options):
+        importer = cls.get_importer(extra_fields, **options)
         return importer.import_data(data)
 
     @classmethod
-    def import_from_filename(cls, filename, extra_fields=[]):
-        importer = cls.get_importer(extra_fields=extra_fields)
+    def import_from_filename(cls, filename, extra_fields=[], workers=None, **options):
+        importer = cls.get_importer(extra_fields=extra_fields, **options)
+        if workers:
+            return importer.import_from_filename(filename, workers=workers)
         return importer.import_from_filename(filename)
 
     @classmethod
-    def import_from_file(cls, file, extra_fields=[]):
-        importer = cls.get_importer(extra_fields=extra_fields)
+    def import_from_file(cls, file, extra_fields=[], **options):
+        importer = cls.get_importer(extra_fields=extra_fields, **options)
         return importer.import_from_file(file)
 
+    @classmethod
+    def iter_import_data(cls, data, extra_fields=[], **options):
+        importer = cls.get_importer(extra_fields, **options)
+        return importer.iter_data(data)
+
+    @classmethod
+    def iter_import_from_filename(cls, filename, extra_fields=[], workers=None, **options):
+        importer = cls.get_importer(extra_fields=extra_fields, **options)
+        if workers:
+            return importer.iter_from_filename(filename, workers=workers)
+        return importer.iter_from_filename(filename)
+
+    @classmethod
+    def iter_import_from_file(cls, file, extra_fields=[], **options):
+        importer = cls.get_importer(extra_fields=extra_fields, **options)
+        return importer.iter_from_file(file)
+
+    @classmethod
+    def import_records(cls, data, extra_fields=[], **options):
+        return list(cls.iter_import_records(data, extra_fields, **options))
+
+    @classmethod
+    def iter_import_records(cls, data, extra_fields=[], **options):
+        """
+        Import the data as compact records, see Record
+        """
+        for row in cls.iter_import_data(data, extra_fields, **options):
+            yield row.as_record()
+
 
 class CsvModel(BaseModel):
 
@@ -230,8 +683,86 @@ class CsvModel(BaseModel):
             "More than a single field and no delimiter defined. You should define a delimiter.")
 
     @classmethod
-    def get_importer(cls, extra_fields=[]):
-        return CsvImporter(csvModel=cls, extra_fields=extra_fields)
+    def get_importer(cls, extra_fields=[], **options):
+        return CsvImporter(csvModel=cls, extra_fields=extra_fields, **options)
+
+    @classmethod
+    async def aimport_stream(cls, stream, extra_fields=[], **options):
+        importer = AsyncCsvImporter(cls, extra_fields=extra_fields, **options)
+        return await importer.import_stream(stream)
+
+    @classmethod
+    def aiter_import_stream(cls, stream, extra_fields=[], **options):
+        importer = AsyncCsvImporter(cls, extra_fields=extra_fields, **options)
+        return importer.iter_stream(stream)
+
+    @classmethod
+    def export_queryset(cls, queryset, file, chunk_size=2000, delimiter=None):
+        """
+        Write the rows of a queryset to a csv file, one column per field.
+        The rows are fetched with values_list by chunks of chunk_size and
+        written by batches, so the memory used does not depend on the size
+        of the queryset. Return the number of rows written.
+        """
+        if delimiter is None:
+            delimiter = cls.Meta.delimiter if cls.has_class_delimiter() else ","
+        schema = cls.get_schema()
+        entries = [entry for entry in schema.entries if not entry.composed]
+        # The keys of a composed field are read through its foreign key
+        composed_keys = {}
+        for entry in schema.entries:
+            if entry.composed:
+                for key in entry.field.keys:
+                    composed_keys[key] = "%s__%s" % (entry.match, key)
+        lookups = []
+        formats = {}
+        for position, entry in enumerate(entries):
+            if entry.ignored:
+                continue
+            if isinstance(entry.match, list):
+                raise ImproperlyConfigured("Field %s matches several columns and cannot be exported." % entry.name)
+            pk = getattr(entry.field, "pk", "pk")
+            if entry.match in composed_keys:
+                lookups.append(composed_keys[entry.match])
+            else:
+                lookups.append(entry.match if pk == "pk" else "%s__%s" % (entry.match, pk))
+            if isinstance(entry.field, DateField):
+                formats[position] = entry.field.format
+        # The ignored fields are exported as empty columns
+        ignored = [position for position, entry in enumerate(entries) if entry.ignored]
+
+        def convert(row):
+            row = list(row)
+            for position in ignored:
+                row.insert(position, "")
+            # The dates are written as they are read back
+            for position, format in formats.items():
+                if row[position] is not None:
+                    row[position] = row[position].strftime(format)
+            return row
+
+        writer = csv.writer(file, delimiter=delimiter)
+        if cls.has_header():
+            writer.writerow([entry.name for entry in entries])
+        rows = queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+        count = 0
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                return count
+            if ignored or formats:
+                batch = [convert(row) for row in batch]
+            writer.writerows(batch)
+            count += len(batch)
+
+    @classmethod
+    def import_columns(cls, data, extra_fields=[]):
+        """
+        Return a dict of typed columns, one per field, instead of an object
+        per line. Only for models of integer, float, decimal, boolean and
+        date fields.
+        """
+        return ColumnImporter(cls, extra_fields=extra_fields).import_data(data)
 
     def construct_obj_from_data(self, data):
         self.validate()
@@ -239,44 +770,47 @@ class CsvModel(BaseModel):
         silent_failure = self.cls.silent_failure()
         self.multiple_creation_field = None
         composed_fields = []
-        index_offset = 0
-        data_offset = 0
-        for position, (attr_name, field) in enumerate(self.attrs):
-            field.position = position
-            if isinstance(field, ComposedKeyField):
-                composed_fields.append(field)
-                index_offset += 1
+        for entry in self.cls.get_schema().entries:
+            if entry.composed:
+                composed_fields.append(entry)
                 continue
-            if self.cls.has_class_delimiter() or self.delimiter:
-                value = data.pop(position - index_offset - data_offset)
-                data_offset += 1
-            else:
-                value = data.pop(0)
+            # Fields are consumed in order, so the value is always the first remaining one
+            value = data.pop(0)
             try:
-                if isinstance(field, IgnoredField):
+                if entry.ignored:
                     continue
-                if hasattr(field, 'has_multiple') and field.has_multiple:
+                if entry.multiple:
                     remaining_data = [value] + data[:] # value should be re-added
                     # as it has been pop before
                     multiple_values = []
-                    for data in remaining_data:
-                        multiple_values.append(self.get_value(attr_name, field, data))
-                    self.set_values(values, self.field_matching_name, multiple_values)
-                    self.multiple_creation_field = self.field_matching_name
+                    for item in remaining_data:
+                        multiple_values.append(self.get_value(entry.name, entry.field, item))
+                    self.set_values(values, entry.match, multiple_values)
+                    self.multiple_creation_field = entry.match
                 else:
-                    value = self.get_value(attr_name, field, value)
-                    self.set_values(values, self.field_matching_name, value)
+                    value = self.get_value(entry.name, entry.field, value)
+                    self.set_values(values, entry.match, value)
             except ValueError as e:
                 if silent_failure:
                    raise SkipRow()
                 else:
+                    if not hasattr(e, "field_name"):
+                        # Reported by the importer
+                        e.field_name = entry.name
+                        e.field_value = value
                     raise e
         if self.cls.is_db_model():
-            for field in composed_fields:
+            for entry in composed_fields:
                 keys = {}
-                for key in field.keys:
+                for key in entry.field.keys:
                     keys[key] = values.pop(key)
-                values[self.field_matching_name] = self.get_value(attr_name, field, keys)
+                try:
+                    values[entry.match] = self.get_value(entry.name, entry.field, keys)
+                except ValueError as e:
+                    # Reported by the importer
+                    e.field_name = entry.name
+                    e.field_value = keys
+                    raise e
             self.create_model_instance(values)
 
 
@@ -317,12 +851,23 @@ class XMLModel(BaseModel):
     def __init__(self, data, element=None):
         super(XMLModel, self).__init__(data)
         self._base_root = element
-        self.construct_obj_from_data(data)
+        with DocumentCache():
+            self.construct_obj_from_data(data)
+
+    def __getstate__(self):
+        state = super(XMLModel, self).__getstate__()
+        state.pop("_base_root", None)
+        return state
+
+    def __setstate__(self, state):
+        super(XMLModel, self).__setstate__(state)
+        self._base_root = None
 
     def validate(self):pass
 
     @classmethod
     def get_root_field(cls):
+        # Fresh copies: the root of the schema fields is reset on each row
         for field_name, field in cls.get_fields():
             if type(field) == XMLRootField:
                 return field_name, field
@@ -347,35 +892,219 @@ class XMLModel(BaseModel):
                    raise
 
     @classmethod
-    def get_importer(cls, *args):
-        return XMLImporter(model=cls)
+    def get_importer(cls, extra_fields=[], **options):
+        return XMLImporter(model=cls, **options)
 
 
 class XMLImporter(object):
-    def __init__(self, model):
+    def __init__(self, model, workers=None, instrument=None, profile=None):
         self.model = model
+        self.workers = workers
+        self.instrument = instrument
+        self.profile = profile
 
     def import_data(self, data):
+        return list(self.iter_data(data))
+
+    def iter_data(self, data):
+        self.model.clear_caches()
+        progress = self.instrument.start() if self.instrument is not None else None
         root_name, root_field = self.model.get_root_field()
-        objects = []
-        for element in root_field.get_root(data):
-            object = self.model(data, element)
-            objects.append(object)
-        return objects
+        if progress is None:
+            elements = root_field.get_root(data)
+        else:
+            progress.characters = len(data)
+            with progress.stage("parse"):
+                elements = root_field.get_root(data)
+        if self.workers and self.workers > 1:
+            chunk_size = self.model.get_schema().prefetch_size or max(len(elements) // (self.workers * 4), 1)
+        else:
+            chunk_size = self.model.get_schema().prefetch_size or max(len(elements), 1)
+        chunks = (elements[start:start + chunk_size] for start in range(0, len(elements), chunk_size))
+        for value in self.iter_chunks(chunks, data, progress):
+            yield value
+
+    def import_from_filename(self, filename, workers=None):
+        return list(self.iter_from_filename(filename, workers=workers))
+
+    def iter_from_filename(self, filename, workers=None):
+        if workers:
+            self.workers = workers
+        with open_compressed(filename) as xml_file:
+            for value in self.iter_from_file(xml_file):
+                yield value
+
+    def import_from_file(self, xml_file):
+        return list(self.iter_from_file(xml_file))
+
+    def iter_from_file(self, xml_file):
+        """
+        Parse the file incrementally: each root element is turned into an
+        object as soon as it is complete, then cleared with the elements
+        before it, so the memory used does not depend on the file size.
+        """
+        self.model.clear_caches()
+        progress = self.instrument.start() if self.instrument is not None else None
+        if self.workers and self.workers > 1:
+            chunk_size = self.model.get_schema().prefetch_size or PARALLEL_XML_CHUNK
+        else:
+            chunk_size = self.model.get_schema().prefetch_size or 1
+        if progress is None:
+            chunks = self.iter_stream(xml_file, chunk_size)
+        else:
+            chunks = progress.timed("parse", self.iter_stream(progress.counted_file(xml_file), chunk_size))
+        return self.iter_chunks(chunks, None, progress)
+
+    def iter_chunks(self, chunks, data, progress):
+        if self.profile is not None:
+            self.profile.install(self.model)
+        try:
+            if self.workers and self.workers > 1:
+                for value in self.iter_parallel(chunks):
+                    if progress is not None:
+                        progress.add_rows()
+                    yield value
+            else:
+                for chunk in chunks:
+                    for value in self.iter_chunk(chunk, data, progress):
+                        yield value
+        finally:
+            if self.profile is not None:
+                self.profile.uninstall()
+            if progress is not None:
+                progress.finish()
+
+    def iter_stream(self, xml_file, chunk_size):
+        """
+        Yield the root elements by chunks, as they are parsed. A chunk is
+        cleared, with the elements before it, once it has been processed.
+        """
+        from lxml import etree
+        root_name, root_field = self.model.get_root_field()
+        steps = self.get_stream_steps(root_field)
+        chunk = []
+        tags = []
+        for event, element in etree.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                tags.append(element.tag)
+                continue
+            if len(tags) == len(steps) and all(step is None or step == tag for step, tag in zip(steps, tags)):
+                chunk.append(element)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    self.clear(chunk)
+                    chunk = []
+            tags.pop()
+        if chunk:
+            yield chunk
+            self.clear(chunk)
+
+    def iter_chunk(self, elements, data=None, progress=None):
+        self.prefetch(elements)
+        for element in elements:
+            if progress is None:
+                yield self.model(data, element)
+                continue
+            with progress.stage("convert"):
+                value = self.model(data, element)
+            progress.add_rows()
+            yield value
+
+    def clear(self, elements):
+        for element in elements:
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def check_worker_paths(self, model):
+        """
+        The workers only get a copy of each root element: a path leaving it
+        would silently find something else than in the document.
+        """
+        for entry in model.get_schema().entries:
+            field = entry.field
+            if type(field) is XMLRootField:
+                continue
+            if isinstance(field, (XMLField, XMLEmbed)) and OUTER_PATH.search(field.path):
+                raise ImproperlyConfigured("The path %s of %s.%s leaves the root element and cannot be "
+                                           "imported with workers." % (field.path, model.__name__, entry.name))
+            if isinstance(field, XMLEmbed):
+                self.check_worker_paths(field.embed_model)
+
+    def iter_parallel(self, chunks):
+        """
+        Build the objects of each chunk of root elements in a pool of
+        processes, each element being serialized on its own. The objects are
+        returned in the document order.
+        """
+        from lxml import etree
+        self.check_worker_paths(self.model)
+        pool = get_pool_context().Pool(self.workers, initializer=init_worker)
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                documents = [etree.tostring(element) for element in chunk]
+                pending.append(pool.apply_async(import_xml_chunk, ((self.model, documents),)))
+                # Bound the number of chunks parsed ahead of the caller
+                if len(pending) > self.workers * 2:
+                    for value in pending.popleft().get():
+                        yield value
+            while pending:
+                for value in pending.popleft().get():
+                    yield value
+        finally:
+            pool.terminate()
+
+    def get_stream_steps(self, root_field):
+        """
+        The tags of the root elements and of their ancestors, None matching
+        any tag. Only simple paths, made of tag names, can be streamed.
+        """
+        path = root_field.path
+        if path == ".":
+            return [None]
+        # An empty step is a descendant axis, as in //person: not streamed
+        steps = (path[1:] if path.startswith("/") else path).split("/")
+        if any(not STREAM_STEP.match(step) for step in steps):
+            raise ImproperlyConfigured("The root path %s cannot be streamed, only tag names "
+                                       "separated by / are supported." % path)
+        tags = [] if path.startswith("/") else [None]
+        for step in steps:
+            if step == "*":
+                tags.append(None)
+            elif ":" in step:
+                prefix, tag = step.split(":")
+                namespaces = root_field.namespaces or {}
+                if prefix not in namespaces:
+                    raise ImproperlyConfigured("Undefined namespace prefix %s" % prefix)
+                tags.append("{%s}%s" % (namespaces[prefix], tag))
+            else:
+                tags.append(step)
+        return tags
+
+    def prefetch(self, elements):
+        for entry in self.model.get_schema().prefetched:
+            field = entry.field
+            values = set()
+            for element in elements:
+                node = field.find_element(element)
+                if node is not None:
+                    value = node.get(field.attribute) if field.attribute else node.text
+                    if value:
+                        values.add(field.prepare(value))
+            with timing("lookup"):
+                field.prefetch_values(values)
 
 
 class LinearLayout(object):
     def process_line(self, lines, line, model, delimiter):
-        fields = model.get_fields()
-        multiple_index = 0
-        for index, (fieldname, field) in enumerate(fields):
-            if hasattr(field, "has_multiple") and field.has_multiple:
-               multiple_index = index
-               multiple_index_fieldname = fieldname
-               break
+        schema = model.get_schema()
+        multiple_index = schema.multiple_index
         if multiple_index:
             if not line[multiple_index:]:
-                raise ValueError("No value found for column %s" % multiple_index_fieldname)
+                raise ValueError("No value found for column %s" % schema.multiple_fieldname)
             for index, val in enumerate(line[multiple_index:]):
                 line_ = line[0:multiple_index] + [line[multiple_index + index]]
                 value = model(data=line_, delimiter=delimiter)
@@ -410,8 +1139,15 @@ class TabularLayout(object):
 
 class GroupedCsvModel(CsvModel):
     @classmethod
-    def get_importer(cls, extra_fields=[]):
-        return GroupedCsvImporter(csvModel=cls, extra_fields=extra_fields)
+    def get_importer(cls, extra_fields=[], **options):
+        return GroupedCsvImporter(csvModel=cls, extra_fields=extra_fields, **options)
+
+    @classmethod
+    def clear_caches(cls):
+        for model in getattr(cls, "csv_models", None) or []:
+            if isinstance(model, dict):
+                model = model['model']
+            model.clear_caches()
 
     @classmethod
     def has_csv_models(cls):
@@ -430,11 +1166,24 @@ class GroupedCsvModel(CsvModel):
 
 
 class CsvImporter(object):
-    def __init__(self, csvModel, extra_fields=[], layout=None):
+    def __init__(self, csvModel, extra_fields=[], layout=None, error_report=None, instrument=None, profile=None,
+                 pipeline=False, feed=None):
         self.csvModel = csvModel
         self.extra_fields = extra_fields
+        # The csv.reader arguments detected for the data, see get_dialect
         self.dialect = None
+        self.header_detected = False
+        # If set, the dialect detected is kept for the next imports of the feed
+        self.feed = feed
         self.delimiter = None
+        self.defer_writes = False
+        # If set, the invalid lines are recorded in the report and skipped
+        self.error_report = error_report
+        self.instrument = instrument
+        # A FieldProfiler, timing the conversion of each field
+        self.profile = profile
+        # If set, read, convert and write the lines in three threads
+        self.pipeline = pipeline
         if not layout:
             if hasattr(self.csvModel, 'Meta') and hasattr(self.csvModel.Meta, 'layout'):
                 self.layout = self.csvModel.Meta.layout()
@@ -460,14 +1209,271 @@ class CsvImporter(object):
                     raise ImproperlyConfigured("Extra field should be a string or a list")
 
     def import_data(self, data):
-        lines = []
+        return list(self.iter_data(data))
+
+    def iter_data(self, data, first_line=0):
+        """
+        Yield the objects built from each line as soon as it is parsed,
+        without keeping the previous ones in memory.
+        """
         self.get_class_delimiter()
+        self.csvModel.clear_caches()
+        if self.pipeline:
+            for value in self.iter_pipeline(data):
+                yield value
+            return
+        self.writer = BulkWriter(defer_all=self.defer_writes)
+        progress = self.instrument.start() if self.instrument is not None else None
+        if progress is None:
+            lines_read = self.read_lines(data)
+        else:
+            lines_read = progress.timed("parse", self.read_lines(progress.counted(data)))
+        line_number = first_line
+        if self.profile is not None:
+            self.profile.install(self.csvModel)
+        try:
+            for line in lines_read:
+                lines = []
+                raw_line = line[:] if self.error_report is not None else None
+                mark = None
+                try:
+                    with self.writer, self.line_transaction():
+                        mark = self.writer.mark()
+                        if progress is None:
+                            self.process_line(data, line, lines, line_number, self.csvModel)
+                        else:
+                            with progress.stage("convert"):
+                                self.process_line(data, line, lines, line_number, self.csvModel)
+                except CsvDataException as e:
+                    if self.error_report is None:
+                        self.writer.write()
+                        raise
+                    # Nothing of a rejected line is kept, even the objects of
+                    # its first models
+                    lines = []
+                    if mark is not None:
+                        self.writer.discard(mark)
+                    self.error_report.add(e, raw_line, self.delimiter)
+                    if progress is not None:
+                        progress.add_error()
+                except Exception:
+                    # The lines before the failing one are kept, as without bulk_size
+                    self.writer.write()
+                    raise
+                if progress is None:
+                    values = self.writer.push(lines)
+                else:
+                    progress.add_rows()
+                    with progress.stage("write"):
+                        values = self.writer.push(lines)
+                for value in values:
+                    yield value
+                line_number += 1
+            if progress is None:
+                values = self.writer.flush()
+            else:
+                with progress.stage("write"):
+                    values = self.writer.flush()
+            for value in values:
+                yield value
+        finally:
+            if self.profile is not None:
+                self.profile.uninstall()
+            if progress is not None:
+                progress.finish()
+
+
+    def iter_pipeline(self, data):
+        """
+        Read the lines, convert them and write their objects in three
+        threads, linked by bounded queues of chunks of lines: reading and
+        converting go on while the database writes. The writes are done
+        with a connection of their own, the objects are returned in order.
+        """
+        if isinstance(self, GroupedCsvImporter):
+            raise ImproperlyConfigured("A pipelined import needs a non grouped model.")
+        if self.instrument is not None:
+            raise ImproperlyConfigured("A pipelined import cannot be instrumented.")
+        # The writing thread commits on its own connection: it would not see
+        # the uncommitted data of the transaction, nor be rolled back with it
+        if any(connection.in_atomic_block for connection in connections.all()):
+            raise ImproperlyConfigured("A pipelined import cannot run in a transaction.")
+        parsed = queue.Queue(PIPELINE_QUEUE)
+        converted = queue.Queue(PIPELINE_QUEUE)
+        written = queue.Queue(PIPELINE_QUEUE)
+        stop = threading.Event()
+        threads = [threading.Thread(target=self.read_stage, args=(data, parsed, stop)),
+                   threading.Thread(target=self.convert_stage, args=(data, parsed, converted, stop)),
+                   threading.Thread(target=self.write_stage, args=(converted, written, stop))]
+        if self.profile is not None:
+            self.profile.install(self.csvModel)
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while True:
+                rows, error = written.get()
+                for value in rows:
+                    yield value
+                if error is StopIteration:
+                    return
+                if error is not None:
+                    raise error
+        finally:
+            # Stop the threads if the import is left before its end
+            stop.set()
+            for thread in threads:
+                thread.join()
+            if self.profile is not None:
+                self.profile.uninstall()
+
+    def read_stage(self, data, parsed, stop):
+        chunk_size = self.csvModel.get_schema().prefetch_size or PIPELINE_CHUNK
+        try:
+            reader = self.get_reader(data)
+            while not stop.is_set():
+                chunk = list(islice(reader, chunk_size))
+                if not chunk:
+                    break
+                pipeline_put(parsed, (chunk, None), stop)
+            pipeline_put(parsed, ([], StopIteration), stop)
+        except Exception as e:
+            pipeline_put(parsed, ([], e), stop)
+
+    def convert_stage(self, data, parsed, converted, stop):
+        """
+        Build the rows of each chunk, their writes being recorded on them
+        """
+        writer = BulkWriter(defer_all=True)
+        prefetch = isinstance(self.layout, LinearLayout)
         line_number = 0
-        for line in csv.reader(data, delimiter=self.delimiter):
-            self.process_line(data, line, lines, line_number, self.csvModel)
-            line_number += 1
-        return lines
-
+        try:
+            while True:
+                chunk, error = pipeline_get(parsed, stop)
+                if error is not None:
+                    pipeline_put(converted, ([], error), stop)
+                    return
+                if prefetch:
+                    self.prefetch(data, chunk)
+                rows = []
+                for line in chunk:
+                    raw_line = line[:] if self.error_report is not None else None
+                    built = len(rows)
+                    try:
+                        with writer:
+                            self.process_line(data, line, rows, line_number, self.csvModel)
+                    except CsvDataException as e:
+                        if self.error_report is None:
+                            pipeline_put(converted, (rows, e), stop)
+                            return
+                        # The writes are recorded on the rows, dropped with them
+                        del rows[built:]
+                        self.error_report.add(e, raw_line, self.delimiter)
+                    except Exception as e:
+                        # The lines before the failing one are kept, as without pipeline
+                        pipeline_put(converted, (rows, e), stop)
+                        return
+                    line_number += 1
+                pipeline_put(converted, (rows, None), stop)
+        except Exception as e:
+            pipeline_put(converted, ([], e), stop)
+        finally:
+            connections.close_all()
+
+    def write_stage(self, converted, written, stop):
+        """
+        Replay the writes of the rows, in order, with a connection of this
+        thread
+        """
+        self.writer = BulkWriter()
+        try:
+            while True:
+                rows, error = pipeline_get(converted, stop)
+                try:
+                    with self.writer:
+                        for row in rows:
+                            self.writer.replay(row)
+                except Exception as e:
+                    error = e
+                if error is not None:
+                    if stop.is_set():
+                        return
+                    if error is StopIteration:
+                        pipeline_put(written, (self.writer.flush(), error), stop)
+                    else:
+                        self.writer.write()
+                        pipeline_put(written, ([], error), stop)
+                    return
+                pipeline_put(written, (self.writer.push(rows), None), stop)
+        except Exception as e:
+            pipeline_put(written, ([], e), stop)
+        finally:
+            connections.close_all()
+
+    def read_lines(self, data):
+        reader = self.get_reader(data)
+        chunk_size = self.csvModel.get_schema().prefetch_size
+        if not chunk_size or not isinstance(self.layout, LinearLayout):
+            return reader
+        return self.prefetch_lines(data, reader, chunk_size)
+
+    def prefetch_lines(self, data, reader, chunk_size):
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                return
+            self.prefetch(data, chunk)
+            for line in chunk:
+                yield line
+
+    def prefetch(self, data, lines):
+        """
+        Resolve the foreign keys of a chunk of lines with a query per field
+        """
+        for entry in self.csvModel.get_schema().prefetched:
+            values = self.get_prefetch_values(data, lines, entry)
+            with timing("lookup"):
+                entry.field.prefetch_values(values)
+
+    def get_prefetch_values(self, data, lines, entry):
+        """
+        The raw values, or composed keys, of a field in a chunk of lines. A
+        multiple field has all the values from its column on.
+        """
+        schema = self.csvModel.get_schema()
+        values = []
+        for line in lines:
+            line = line[:]
+            self.process_extra_fields(data, line)
+            try:
+                if entry.composed:
+                    values.append(self.get_composed_key(schema, entry, line))
+                elif entry.multiple:
+                    values.extend(entry.field.prepare(value) for value in line[entry.column:] if value)
+                elif len(line) > entry.column and line[entry.column]:
+                    values.append(entry.field.prepare(line[entry.column]))
+            except Exception:
+                # Reported when the line itself is processed
+                continue
+        return values
+
+    def get_composed_key(self, schema, entry, line):
+        keys = {}
+        for key in entry.field.keys:
+            key_entry = schema.matches[key]
+            keys[key] = key_entry.convert(line[key_entry.column])
+        return keys
+
+    def line_transaction(self):
+        """
+        With an error report, the objects saved as a line is processed are
+        in a savepoint, rolled back if the line is rejected. The deferred
+        writes are discarded instead.
+        """
+        if self.error_report is None or self.writer.defer_all or not self.csvModel.is_db_model() \
+                or self.csvModel.bulk_size():
+            return contextlib.nullcontext()
+        return transaction.atomic()
 
     def process_line(self, data, line, lines, line_number, model):
         self.process_extra_fields(data, line)
@@ -477,12 +1483,15 @@ class CsvImporter(object):
         except SkipRow:
             pass
         except ForeignKeyFieldError as e:
-            raise CsvFieldDataException(line_number, field_error=str(e), model=e.model, value=e.value)
+            raise CsvFieldDataException(line_number, field_error=str(e), model=e.model, value=e.value,
+                                        field_name=getattr(e, "field_name", None))
         except ValueError as e:
-            if line_number == 0 and self.csvModel.has_header():
+            if line_number == 0 and (self.csvModel.has_header() or self.header_detected):
                 pass
             else:
-                raise CsvDataException(line_number, field_error=str(e))
+                raise CsvDataException(line_number, field_error=str(e),
+                                       field_name=getattr(e, "field_name", None),
+                                       value=getattr(e, "field_value", None))
         except IndexError as e:
             raise CsvDataException(line_number, error="Number of fields invalid")
         return value
@@ -492,17 +1501,110 @@ class CsvImporter(object):
         if not self.delimiter and hasattr(self.csvModel, 'Meta') and hasattr(self.csvModel.Meta, 'delimiter'):
             self.delimiter = self.csvModel.Meta.delimiter
 
-    def import_from_filename(self, filename):
-        csv_file = open(filename)
-        return self.import_from_file(csv_file)
+    def get_dialect(self, sample):
+        """
+        Without a delimiter, detect the dialect of the data from a sample of
+        it, or take the one detected for the feed
+        """
+        self.get_class_delimiter()
+        if self.delimiter:
+            return
+        detected = _dialects.get((self.csvModel, self.feed)) if self.feed is not None else None
+        if detected is None:
+            detected = sniff_dialect(sample)
+            if self.feed is not None:
+                _dialects[(self.csvModel, self.feed)] = detected
+        self.dialect, self.header_detected = detected
+        # A has_header declared by the model, even False, is not second-guessed
+        if hasattr(self.csvModel, "Meta") and hasattr(self.csvModel.Meta, "has_header"):
+            self.header_detected = False
+        self.delimiter = self.dialect["delimiter"]
+
+    def get_reader(self, data):
+        if self.dialect is None:
+            return csv.reader(data, delimiter=self.delimiter)
+        return csv.reader(data, **dict(self.dialect, delimiter=self.delimiter))
+
+    def import_from_filename(self, filename, workers=None):
+        return list(self.iter_from_filename(filename, workers=workers))
+
+    def iter_from_filename(self, filename, workers=None):
+        compressed = get_compression(filename) is not None
+        if workers and workers > 1:
+            if compressed:
+                raise ImproperlyConfigured("A compressed file cannot be split for a parallel import.")
+            for value in self.iter_parallel(filename, workers):
+                yield value
+            return
+        if compressed:
+            # Decompressed as it is parsed
+            with open_compressed(filename) as binary_file:
+                csv_file = io.TextIOWrapper(binary_file, encoding=locale.getpreferredencoding(False), newline='')
+                for value in self.iter_from_file(csv_file):
+                    yield value
+            return
+        with MappedFile(filename) as mapped_file:
+            for value in self.iter_from_mapped_file(mapped_file):
+                yield value
+
+    def iter_from_mapped_file(self, mapped_file, start=0, end=None, first_line=0):
+        """
+        Import a byte range of a mapped file, decoded as it is parsed
+        """
+        self.get_dialect(mapped_file.sample(self.csvModel.sniff_size()))
+        return self.iter_data(mapped_file.lines(start, end), first_line=first_line)
+
+    def iter_parallel(self, filename, workers):
+        """
+        Parse and validate byte ranges of the file in a pool of processes.
+        The objects are written to the database here, in the file order.
+        """
+        if not isinstance(self.layout, LinearLayout) or isinstance(self, GroupedCsvImporter):
+            raise ImproperlyConfigured("A parallel import needs a LinearLayout and a non grouped model.")
+        self.get_class_delimiter()
+        if not self.delimiter:
+            with MappedFile(filename) as mapped_file:
+                self.get_dialect(mapped_file.sample(self.csvModel.sniff_size()))
+        error_report = self.error_report.spawn() if self.error_report is not None else None
+        dialect = (self.delimiter, self.dialect, self.header_detected)
+        quotechar = self.dialect["quotechar"] if self.dialect is not None else '"'
+        tasks = [(self.csvModel, self.extra_fields, dialect, error_report, filename, start, end, first_line)
+                 for start, end, first_line in split_records(filename, workers * 4, quotechar=quotechar)]
+        self.writer = BulkWriter()
+        pool = get_pool_context().Pool(workers, initializer=init_worker)
+        try:
+            for rows, error, error_report in pool.imap(import_chunk, tasks):
+                if error_report is not None:
+                    self.error_report.merge(error_report)
+                try:
+                    with self.writer:
+                        for row in rows:
+                            self.writer.replay(row)
+                except Exception:
+                    self.writer.write()
+                    raise
+                if error is not None:
+                    self.writer.write()
+                    raise error
+                for value in self.writer.push(rows):
+                    yield value
+            for value in self.writer.flush():
+                yield value
+        finally:
+            pool.terminate()
 
     def import_from_file(self, csv_file):
+        return list(self.iter_from_file(csv_file))
+
+    def iter_from_file(self, csv_file):
         self.get_class_delimiter()
-        if not self.delimiter:
-            dialect = csv.Sniffer().sniff(csv_file.read(1024))
-            self.delimiter = dialect.delimiter
-        csv_file.seek(0)
-        return self.import_data(csv_file)
+        if self.delimiter or (self.feed is not None and (self.csvModel, self.feed) in _dialects):
+            self.get_dialect(None)
+            return self.iter_data(csv_file)
+        # The sample is given back to the parser rather than seeked: the file may be a stream
+        sample, data = read_sample(csv_file, self.csvModel.sniff_size())
+        self.get_dialect(sample)
+        return self.iter_data(data)
 
 
     def __getitem__(self, item):
@@ -513,13 +1615,104 @@ class CsvImporter(object):
 
 
 class GroupedCsvImporter(CsvImporter):
+    def line_transaction(self):
+        if self.error_report is None or self.writer.defer_all:
+            return contextlib.nullcontext()
+        # A model used by the next one is written in the middle of the line:
+        # the previous lines are written before, out of its savepoint
+        if any(isinstance(model, dict) and "use" in model for model in self.csvModel.csv_models):
+            self.writer.write()
+        return transaction.atomic()
+
     def process_line(self, data, line, lines, line_number, model):
         previous_value = None
         for model in self.csvModel.csv_models:
             if isinstance(model, dict):
                 if "use" in model:
+                    # The object is needed now, do not wait for the batch to be full
+                    self.writer.write()
                     line.insert(0, previous_value.get_object().id)
                 previous_value = super(GroupedCsvImporter, self).process_line(data, line, lines, line_number,
                                                                               model['model'])
             else:
                 super(GroupedCsvImporter, self).process_line(data, line, lines, line_number, model)
+
+
+def pipeline_put(stage_queue, item, stop):
+    """
+    Put an item in the queue of the next stage of a pipeline, unless the
+    pipeline is stopped while waiting for room
+    """
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def pipeline_get(stage_queue, stop):
+    """
+    Get an item from the queue of the previous stage of a pipeline. Once the
+    pipeline is stopped, give a StopIteration to end the stage.
+    """
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return [], StopIteration
+
+
+_inherited_connections = []
+
+
+def get_pool_context():
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        return multiprocessing.get_context()
+
+
+def init_worker():
+    """
+    Make a forked worker open its own database connections, while keeping
+    the ones of the parent alive and untouched.
+    An in memory database only exists in the inherited connection.
+    """
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        if getattr(connection, "is_in_memory_db", lambda: False)():
+            continue
+        _inherited_connections.append(connection.connection)
+        connection.connection = None
+
+
+def import_xml_chunk(task):
+    """
+    Build the objects of serialized XML root elements in a worker
+    """
+    from lxml import etree
+    model, documents = task
+    importer = model.get_importer()
+    return list(importer.iter_chunk([etree.fromstring(document) for document in documents]))
+
+
+def import_chunk(task):
+    """
+    Import a byte range of a file in a worker. The database writes are only
+    recorded on the rows, to be done by the parent process.
+    """
+    model, extra_fields, dialect, error_report, filename, start, end, first_line = task
+    importer = model.get_importer(extra_fields=extra_fields, error_report=error_report)
+    importer.delimiter, importer.dialect, importer.header_detected = dialect
+    importer.defer_writes = True
+    rows = []
+    with MappedFile(filename) as mapped_file:
+        try:
+            for row in importer.iter_from_mapped_file(mapped_file, start, end, first_line=first_line):
+                rows.append(row)
+        except CsvException as e:
+            return rows, e, error_report
+    return rows, None, error_report
@@ -0,0 +1,168 @@
+"""
+Find the slow fields of an import
+"""
+import time
+
+from adaptor.validators import validate_many
+
+
+class StepStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+
+def timed(function, stats):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            stats.failures += 1
+            raise
+        finally:
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - start
+    return wrapper
+
+
+def timed_transform(get_transform_method, stats):
+    def wrapper(instance):
+        return timed(get_transform_method(instance), stats)
+    return wrapper
+
+
+class TimedChoices(object):
+    """
+    Count a value missing from the choices as a failure
+    """
+    def __init__(self, choices, stats):
+        self.choices = choices
+        self.stats = stats
+
+    def __contains__(self, value):
+        start = time.perf_counter()
+        try:
+            found = value in self.choices
+        except Exception:
+            self.stats.failures += 1
+            raise
+        finally:
+            self.stats.calls += 1
+            self.stats.seconds += time.perf_counter() - start
+        if not found:
+            self.stats.failures += 1
+        return found
+
+    def __str__(self):
+        return str(self.choices)
+
+
+class TimedValidator(object):
+    """
+    Stand for the validator class of a field: count an invalid value as a
+    failure
+    """
+    def __init__(self, validator, stats):
+        self.validator = validator
+        self.stats = stats
+        self.instance = None
+
+    def __call__(self):
+        self.instance = self.validator()
+        return self
+
+    def validate(self, value):
+        start = time.perf_counter()
+        try:
+            valid = self.instance.validate(value)
+        except Exception:
+            self.stats.failures += 1
+            raise
+        finally:
+            self.stats.calls += 1
+            self.stats.seconds += time.perf_counter() - start
+        if not valid:
+            self.stats.failures += 1
+        return valid
+
+    def validate_many(self, values):
+        start = time.perf_counter()
+        try:
+            valid = validate_many(self.instance, values)
+        except Exception:
+            self.stats.failures += 1
+            raise
+        finally:
+            self.stats.calls += len(values)
+            self.stats.seconds += time.perf_counter() - start
+        self.stats.failures += valid.count(False)
+        return valid
+
+    def __getattr__(self, name):
+        return getattr(self.validator, name)
+
+
+class FieldProfiler(object):
+    """
+    Given to an import with profile=, time each step of the conversion of
+    the values of each field: prepare, to_python, choices, transform and
+    validator. The steps are wrapped during the import only, the fields are
+    left untouched otherwise.
+    """
+    def __init__(self):
+        # (field, step) -> StepStats
+        self.stats = {}
+        self.installed = []
+
+    def get_stats(self, label, step):
+        key = (label, step)
+        if key not in self.stats:
+            self.stats[key] = StepStats()
+        return self.stats[key]
+
+    def install(self, model):
+        from adaptor.fields import Field, XMLEmbed, XMLRootField
+        for csv_model in getattr(model, "csv_models", None) or []:
+            self.install(csv_model['model'] if isinstance(csv_model, dict) else csv_model)
+        for entry in model.get_schema().entries:
+            field = entry.field
+            if isinstance(field, XMLEmbed):
+                self.install(field.embed_model)
+                continue
+            # The Django fields of a CsvDbModel are shared by the whole process:
+            # only the adaptor fields are profiled. A field shared by several
+            # models is wrapped once.
+            if not isinstance(field, Field) or isinstance(field, XMLRootField) \
+                    or "get_transform_method" in field.__dict__:
+                continue
+            label = "%s.%s" % (model.__name__, entry.name)
+            self.wrap(field, "prepare", timed(field.prepare, self.get_stats(label, "prepare")))
+            self.wrap(field, "to_python", timed(field.to_python, self.get_stats(label, "to_python")))
+            self.wrap(field, "choices", TimedChoices(field.choices, self.get_stats(label, "choices")))
+            self.wrap(field, "get_transform_method",
+                      timed_transform(field.get_transform_method, self.get_stats(label, "transform")))
+            self.wrap(field, "validator", TimedValidator(field.validator, self.get_stats(label, "validator")))
+
+    def wrap(self, field, name, wrapper):
+        self.installed.append((field, name, field.__dict__.get(name), name in field.__dict__))
+        setattr(field, name, wrapper)
+
+    def uninstall(self):
+        for field, name, value, own in reversed(self.installed):
+            if own:
+                setattr(field, name, value)
+            else:
+                delattr(field, name)
+        self.installed = []
+
+    def report(self):
+        lines = ["%-30s %-10s %10s %9s %10s %12s" % ("field", "step", "calls", "failures", "seconds", "usec/call")]
+        for (label, step), stats in sorted(self.stats.items(), key=lambda item: -item[1].seconds):
+            if not stats.calls:
+                continue
+            lines.append("%-30s %-10s %10d %9d %10.4f %12.2f" % (label, step, stats.calls, stats.failures,
+                                                                 stats.seconds,
+                                                                 stats.seconds / stats.calls * 1e6))
+        return "\n".join(lines)
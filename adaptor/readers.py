@@ -0,0 +1,235 @@
+"""
+Low level access to the files being imported
+"""
+import bz2
+import codecs
+import csv
+import gzip
+import io
+import locale
+import lzma
+import mmap
+import os
+from itertools import chain
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Characters sniffed to detect the dialect of a csv file, by default
+SNIFF_SIZE = 1 << 14
+
+
+def sniff_dialect(sample):
+    """
+    Detect the format of a csv sample. Return the csv.reader arguments for
+    it and whether its first line looks like a header.
+    """
+    # A line cut at the end of the sample would mislead the sniffer
+    if not sample.endswith("\n") and "\n" in sample:
+        sample = sample[:sample.rfind("\n") + 1]
+    sniffer = csv.Sniffer()
+    dialect = sniffer.sniff(sample)
+    try:
+        has_header = sniffer.has_header(sample)
+    except csv.Error:
+        has_header = False
+    params = {"delimiter": dialect.delimiter, "quotechar": dialect.quotechar,
+              "skipinitialspace": dialect.skipinitialspace, "doublequote": True}
+    # The sniffer does not find doubled quotes in a sample without any:
+    # quotes are only escaped by a backslash if the sample shows it
+    quotechar = dialect.quotechar
+    if "\\" + quotechar in sample and quotechar * 2 not in sample:
+        params.update(doublequote=False, escapechar="\\")
+    return params, has_header
+
+
+def read_sample(csv_file, size):
+    """
+    Read about `size` characters of a text file, up to the end of a line.
+    Return the sample and the whole data, the sample included: the file is
+    not seeked, it may be a stream.
+    """
+    sample = csv_file.read(size)
+    if sample and not sample.endswith("\n"):
+        sample += csv_file.readline()
+    return sample, chain(io.StringIO(sample, newline=''), csv_file)
+
+
+# Bytes read at once from a compressed file, and from its decompressed stream
+COMPRESSED_BUFFER_SIZE = 1 << 20
+
+# name, magic bytes, file extensions
+COMPRESSIONS = [("gzip", b"\x1f\x8b", (".gz", ".gzip")),
+                ("bz2", b"BZh", (".bz2",)),
+                ("xz", b"\xfd7zXZ\x00", (".xz", ".lzma")),
+                ("zstd", b"\x28\xb5\x2f\xfd", (".zst", ".zstd"))]
+
+
+def get_compression(filename):
+    """
+    The compression of a file, found by its magic bytes or else by its
+    extension, None if it is not compressed
+    """
+    with open(filename, 'rb') as input_file:
+        start = input_file.read(8)
+    for name, magic, extensions in COMPRESSIONS:
+        if start.startswith(magic):
+            return name
+    for name, magic, extensions in COMPRESSIONS:
+        if filename.lower().endswith(extensions):
+            return name
+    return None
+
+
+def decompress(compressed_file, compression):
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=compressed_file, mode='rb')
+    if compression == "bz2":
+        return bz2.BZ2File(compressed_file)
+    if compression == "xz":
+        return lzma.LZMAFile(compressed_file)
+    if zstd is not None:
+        return zstd.ZstdFile(compressed_file)
+    if zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(compressed_file, read_size=COMPRESSED_BUFFER_SIZE)
+    raise ImportError("The zstandard package is needed to read zstd files.")
+
+
+class DecompressedFile(io.BufferedReader):
+    """
+    A compressed file read as a binary file, decompressed as it is read,
+    closing the compressed file with it
+    """
+    def __init__(self, compressed_file, compression, buffer_size=COMPRESSED_BUFFER_SIZE):
+        super(DecompressedFile, self).__init__(decompress(compressed_file, compression), buffer_size)
+        self.compressed_file = compressed_file
+
+    def close(self):
+        try:
+            super(DecompressedFile, self).close()
+        finally:
+            self.compressed_file.close()
+
+
+def open_compressed(filename, buffer_size=COMPRESSED_BUFFER_SIZE):
+    """
+    Open a file as a binary file, decompressed as it is read if it is
+    compressed
+    """
+    compression = get_compression(filename)
+    compressed_file = open(filename, 'rb', buffering=buffer_size)
+    if compression is None:
+        return compressed_file
+    try:
+        return DecompressedFile(compressed_file, compression, buffer_size)
+    except Exception:
+        compressed_file.close()
+        raise
+
+
+def split_records(filename, chunks, quotechar='"', block_size=1 << 20):
+    """
+    Split a file in about `chunks` byte ranges ending on a record boundary,
+    that is a newline outside of a quoted value.
+    Return a list of (start, end, first_line) where first_line is the number
+    of records before the range.
+    """
+    size = os.path.getsize(filename)
+    targets = [size * index // chunks for index in range(1, chunks)]
+    quote = quotechar.encode()
+    ranges = []
+    start = first_line = lines = offset = 0
+    in_quote = False
+    with open(filename, 'rb') as csv_file:
+        while True:
+            block = csv_file.read(block_size)
+            if not block:
+                break
+            position = 0
+            while position < len(block):
+                quote_at = block.find(quote, position)
+                end = len(block) if quote_at == -1 else quote_at
+                if not in_quote:
+                    while targets:
+                        newline = block.find(b'\n', max(position, targets[0] - offset), end)
+                        if newline == -1:
+                            break
+                        lines += block.count(b'\n', position, newline + 1)
+                        position = newline + 1
+                        ranges.append((start, offset + position, first_line))
+                        start, first_line = offset + position, lines
+                        targets = [target for target in targets if target > start]
+                    lines += block.count(b'\n', position, end)
+                if quote_at == -1:
+                    break
+                in_quote = not in_quote
+                position = quote_at + 1
+            offset += len(block)
+    if start < size:
+        ranges.append((start, size, first_line))
+    return ranges
+
+
+class MappedFile(object):
+    """
+    A file mapped in memory, read without copying it. Views are byte ranges
+    of the map; text is decoded from them by blocks, when it is iterated.
+    To be used as a context manager, closing the file on exit.
+    """
+    def __init__(self, filename, encoding=None, block_size=1 << 20):
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.block_size = block_size
+        self.file = open(filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # An empty file cannot be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.buffer = memoryview(self.map if self.map is not None else b"")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Every view given must have been released
+        self.buffer.release()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def view(self, start=0, end=None):
+        return self.buffer[start:self.size if end is None else end]
+
+    def sample(self, size=1024):
+        """
+        The text of the first `size` bytes, a character cut at the end left out
+        """
+        return codecs.getincrementaldecoder(self.encoding)().decode(self.buffer[:size])
+
+    def find(self, sub, start, end):
+        if self.map is None:
+            return -1
+        return self.map.find(sub, start, end)
+
+    def lines(self, start=0, end=None):
+        """
+        Iterate on the lines of a byte range, newlines kept as with
+        newline=''. The text is decoded by blocks ending on a newline.
+        """
+        return chain.from_iterable(self.blocks(start, end))
+
+    def blocks(self, start=0, end=None):
+        end = self.size if end is None else end
+        while start < end:
+            cut = self.find(b'\n', min(start + self.block_size, end) - 1, end)
+            cut = end if cut == -1 else cut + 1
+            yield io.StringIO(str(self.buffer[start:cut], self.encoding), newline='')
+            start = cut
@@ -0,0 +1,87 @@
+"""
+Collect the errors of an import instead of stopping on the first one
+"""
+import csv
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+
+RejectedLine = namedtuple("RejectedLine", "line field value message")
+
+
+class ErrorReport(object):
+    """
+    Keep the first `max_errors` errors of an import and count the others.
+    If `rejects` is a file, every rejected line is written to it as csv.
+    With `spool`, they are written to a temporary file instead, which is
+    copied to the rejects of the report it is merged into.
+    """
+    def __init__(self, max_errors=1000, rejects=None, spool=False):
+        self.max_errors = max_errors
+        self.rejects = rejects
+        self.spool = spool
+        self.spool_name = None
+        self.errors = []
+        self.count = 0
+        self.writer = None
+
+    def add(self, error, line, delimiter=None):
+        self.count += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append(RejectedLine(error.line, error.field_name, error.value,
+                                            error.error or error.field_error))
+        self.reject(line, delimiter)
+
+    def reject(self, line, delimiter=None):
+        if self.rejects is None:
+            if not self.spool:
+                return
+            self.rejects = tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", delete=False)
+            self.spool_name = self.rejects.name
+        if self.writer is None:
+            self.writer = csv.writer(self.rejects, delimiter=delimiter or ",")
+        self.writer.writerow(line)
+
+    def spawn(self):
+        """
+        A report for a worker of a parallel import, to be merged back
+        """
+        return ErrorReport(self.max_errors, spool=self.rejects is not None)
+
+    def merge(self, report):
+        self.count += report.count
+        space = None if self.max_errors is None else max(self.max_errors - len(self.errors), 0)
+        self.errors.extend(report.errors[:space])
+        if report.spool_name is None:
+            return
+        try:
+            # Both are written with the delimiter of the import
+            with open(report.spool_name, newline="") as spooled:
+                shutil.copyfileobj(spooled, self.rejects)
+        finally:
+            os.remove(report.spool_name)
+
+    def __getstate__(self):
+        # A spawned report goes back to the parent process with the name of
+        # its rejects file only
+        state = self.__dict__.copy()
+        if self.spool and self.rejects is not None:
+            self.rejects.close()
+            state["rejects"] = None
+            state["writer"] = None
+        return state
+
+    @property
+    def truncated(self):
+        return self.count > len(self.errors)
+
+    def is_valid(self):
+        return self.count == 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.errors)
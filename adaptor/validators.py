@@ -1,9 +1,60 @@
 import re
 
-class GenericRegexValidator(object):
+
+class BaseValidator(object):
+    validation_message = "The value is not valid"
+
     def validate(self, value):
-        return bool(re.match(self.regex, value))
+        raise NotImplementedError
+
+    def validate_many(self, values):
+        """
+        Validate a batch of values, return a list of booleans
+        """
+        return [self.validate(value) for value in values]
+
+
+class GenericRegexValidator(BaseValidator):
+    regex = None
+    pattern = None
+    validation_message = "The value does not match the expected pattern"
+
+    def __init_subclass__(cls, **kwargs):
+        super(GenericRegexValidator, cls).__init_subclass__(**kwargs)
+        # Compiled once, when the validator class is created
+        if "regex" in cls.__dict__:
+            cls.pattern = re.compile(cls.regex)
+
+    def get_pattern(self):
+        """
+        The regex compiled once, and again only if it is changed. It is kept
+        on the class, or on the instance if the regex was set on it.
+        """
+        pattern = self.pattern
+        if pattern is None or (pattern is not self.regex and pattern.pattern != self.regex):
+            pattern = re.compile(self.regex)
+            if "regex" in self.__dict__:
+                self.pattern = pattern
+            else:
+                type(self).pattern = pattern
+        return pattern
+
+    def validate(self, value):
+        return bool(self.get_pattern().match(value))
+
+    def validate_many(self, values):
+        match = self.get_pattern().match
+        return [bool(match(value)) for value in values]
+
 
 def RegexValidator(name, regex):
     return type(name, (GenericRegexValidator,), {'regex':regex})
-    
+
+
+def validate_many(validator, values):
+    """
+    Validate a batch of values with any validator, even without validate_many
+    """
+    if hasattr(validator, "validate_many"):
+        return list(validator.validate_many(values))
+    return [validator.validate(value) for value in values]
@@ -1,19 +1,305 @@
-from datetime import datetime
-from adaptor.model import CsvModel
+#!/usr/bin/env python
+"""
+Benchmark the importers against an in memory SQLite database.
+
+    ./performance.py                          # run every benchmark
+    ./performance.py -r 1000 -r 100000 -w 3 -w 30 csv_model
+    ./performance.py --save baseline.json
+    ./performance.py --compare baseline.json
+
+Each benchmark reports the rows imported per second and the peak memory
+allocated during the import. Results saved with --save can be compared with
+a later run with --compare to spot regressions.
+"""
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+            DATABASES={
+                'default': {
+                    'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': ':memory:',
+                }
+            },
+            INSTALLED_APPS=[
+                'tests.test_app',
+            ],
+            DEFAULT_AUTO_FIELD='django.db.models.AutoField',
+        )
+    django.setup()
+
+from django.core.management import call_command
+
 from adaptor.fields import *
+from adaptor.model import CsvModel, CsvDbModel, GroupedCsvModel, TabularLayout, XMLModel
+from tests.test_app.models import MyModel, MyModelWithForeign, FirstNameModel, LastNameModel
+
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """
+    Register a benchmark. The function takes the number of rows and the
+    width, and returns the import to time and the number of rows it imports.
+    """
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+@benchmark
+def csv_model(rows, width):
+    fields = {'name': CharField()}
+    for index in range(width - 1):
+        fields['value_%d' % index] = IntegerField() if index % 2 else FloatField()
+    fields['Meta'] = type('Meta', (), {'delimiter': ';'})
+    model = type('BenchCsvModel', (CsvModel,), fields)
+    line = ";".join(["jojo"] + [str(index) for index in range(width - 1)])
+    data = [line] * rows
+    return lambda: model.import_data(data), rows
+
+
+@benchmark
+def csv_db_model(rows, width):
+    class BenchCsvDbModel(CsvDbModel):
+        class Meta:
+            dbModel = MyModel
+            delimiter = ";"
+
+    data = ["jojo;12;1.8"] * rows
+    return lambda: BenchCsvDbModel.import_data(data), rows
+
+
+@benchmark
+def csv_db_model_bulk(rows, width):
+    class BenchCsvDbModel(CsvDbModel):
+        class Meta:
+            dbModel = MyModel
+            delimiter = ";"
+            bulk_size = 1000
+
+    data = ["jojo;12;1.8"] * rows
+    return lambda: BenchCsvDbModel.import_data(data), rows
+
+
+@benchmark
+def grouped_csv_model(rows, width):
+    class BenchFirstName(CsvModel):
+        first_name = CharField()
+
+        class Meta:
+            dbModel = FirstNameModel
+
+    class BenchLastName(CsvModel):
+        last_name = CharField()
+
+        class Meta:
+            dbModel = LastNameModel
+
+    class BenchGrouped(GroupedCsvModel):
+        csv_models = [BenchFirstName, BenchLastName]
+
+        class Meta:
+            delimiter = ";"
+
+    data = ["jojo;lafrite"] * rows
+    return lambda: BenchGrouped.import_data(data), rows
+
+
+@benchmark
+def tabular_layout(rows, width):
+    class BenchTabular(CsvModel):
+        nom = CharField()
+        age = IntegerField()
+        taille = FloatField()
+
+        class Meta:
+            delimiter = ";"
+            layout = TabularLayout
+
+    lines = max(rows // width, 1)
+    data = [";".join([""] + [str(index) for index in range(width)])]
+    data += [";".join(["jojo"] + ["1.8"] * width)] * lines
+    return lambda: BenchTabular.import_data(data), lines * width
+
+
+@benchmark
+def foreign_key(rows, width):
+    class BenchForeign(CsvModel):
+        foreign = DjangoModelField(MyModel)
+
+        class Meta:
+            delimiter = ";"
+
+    targets = [MyModel.objects.create(nom="jojo", age=12, taille=1.8).pk for index in range(10)]
+    data = [str(targets[index % 10]) for index in range(rows)]
+    return lambda: BenchForeign.import_data(data), rows
+
+
+@benchmark
+def foreign_key_prefetch(rows, width):
+    class BenchForeign(CsvModel):
+        foreign = DjangoModelField(MyModel, prefetch=1000)
+
+        class Meta:
+            delimiter = ";"
+
+    targets = [MyModel.objects.create(nom="jojo", age=12, taille=1.8).pk for index in range(10)]
+    data = [str(targets[index % 10]) for index in range(rows)]
+    return lambda: BenchForeign.import_data(data), rows
+
+
+@benchmark
+def update(rows, width):
+    class BenchUpdate(CsvModel):
+        nom = CharField()
+        age = IntegerField()
+        taille = FloatField()
+
+        class Meta:
+            dbModel = MyModel
+            delimiter = ";"
+            update = {'keys': ['nom', 'age']}
+
+    data = ["jojo;%d;1.8" % (index % 100) for index in range(rows)]
+    return lambda: BenchUpdate.import_data(data), rows
+
+
+@benchmark
+def xml_model(rows, width):
+    class BenchXML(XMLModel):
+        root = XMLRootField(path="person")
+        name = XMLCharField(path="name")
+        age = XMLIntegerField(path="age")
+        length = XMLFloatField(path="length", attribute="value")
+
+    person = "<person><name>jojo</name><age>12</age><length value='1.8'/></person>"
+    data = "<data>%s</data>" % (person * rows)
+    return lambda: BenchXML.import_data(data), rows
+
+
+@benchmark
+def xml_embed(rows, width):
+    class BenchInfo(XMLModel):
+        root = XMLRootField(path="info")
+        age = XMLIntegerField(path="age")
+
+    class BenchXML(XMLModel):
+        root = XMLRootField(path="person")
+        name = XMLCharField(path="name")
+        info = XMLEmbed(BenchInfo)
+
+    person = "<person><name>jojo</name><info><age>12</age></info><info><age>13</age></info></person>"
+    data = "<data>%s</data>" % (person * rows)
+    return lambda: BenchXML.import_data(data), rows
+
+
+def reset_database():
+    for model in (MyModelWithForeign, MyModel, FirstNameModel, LastNameModel):
+        model.objects.all().delete()
+
+
+def run(name, rows, width, memory=True):
+    reset_database()
+    function, imported = BENCHMARKS[name](rows, width)
+    gc.collect()
+    before = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - before
+    peak = None
+    if memory:
+        reset_database()
+        function, imported = BENCHMARKS[name](rows, width)
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        'benchmark': name,
+        'rows': rows,
+        'width': width,
+        'imported': imported,
+        'seconds': seconds,
+        'rows_per_sec': imported / seconds if seconds else None,
+        'peak_memory': peak,
+    }
+
+
+def key(result):
+    return "%(benchmark)s/%(rows)d/%(width)d" % result
+
+
+def report(results, baseline=None, threshold=0.1):
+    regressions = 0
+    print("%-22s %9s %5s %12s %12s %s" % ("benchmark", "rows", "width", "rows/sec", "peak KiB",
+                                          "vs baseline" if baseline else ""))
+    for result in results:
+        comparison = ""
+        previous = baseline.get(key(result)) if baseline else None
+        if previous and previous['rows_per_sec'] and result['rows_per_sec']:
+            ratio = result['rows_per_sec'] / previous['rows_per_sec']
+            comparison = "%+.1f%%" % ((ratio - 1) * 100)
+            if ratio < 1 - threshold:
+                comparison += " REGRESSION"
+                regressions += 1
+        peak = "%d" % (result['peak_memory'] // 1024) if result['peak_memory'] is not None else "-"
+        print("%-22s %9d %5d %12.0f %12s %s" % (result['benchmark'], result['rows'], result['width'],
+                                                result['rows_per_sec'] or 0, peak, comparison))
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Benchmark the django-adaptors importers.")
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help="benchmarks to run, all by default: %s" % ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument('-r', '--rows', type=int, action='append',
+                        help="number of rows, can be repeated (default: 10000)")
+    parser.add_argument('-w', '--width', type=int, action='append',
+                        help="number of columns of the csv_model and tabular_layout benchmarks, "
+                             "can be repeated (default: 3)")
+    parser.add_argument('--no-memory', action='store_true', help="do not measure the peak memory")
+    parser.add_argument('--save', metavar='FILE', help="save the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE', help="compare the results with a JSON baseline")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slow down reported as a regression (default: 0.1)")
+    options = parser.parse_args(argv)
+    for name in options.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %s" % name)
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    results = []
+    for name in options.benchmarks or sorted(BENCHMARKS):
+        for rows in options.rows or [10000]:
+            for width in options.width or [3]:
+                results.append(run(name, rows, width, memory=not options.no_memory))
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = dict((key(result), result) for result in json.load(baseline_file)['results'])
+    regressions = report(results, baseline, options.threshold)
+
+    if options.save:
+        with open(options.save, 'w') as baseline_file:
+            json.dump({
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, baseline_file, indent=2)
+    return 1 if regressions else 0
+
 
-class MyCSvModel(CsvModel):
-    name = CharField()
-    age = IntegerField()
-    length = FloatField()
-
-    class Meta:
-        delimiter = ";"
-
-def test_performance(row=100000, cycle=10):
-    before = datetime.now()
-    data = ['jojo; 12; 1.8']*row
-    for i in range(cycle):   
-       MyCSvModel.import_data(data=data)
-    after = datetime.now()
-    print after - before
+if __name__ == '__main__':
+    sys.exit(main())
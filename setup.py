@@ -19,7 +19,8 @@ setup(name='django-adaptors',
           'Django>=1.4',
       ],
       extras_require={
-          'XML': ['lxml>=2.3.4']
+          'XML': ['lxml>=2.3.4'],
+          'columns': ['numpy'],
       },
       classifiers=[
           "Development Status :: 3 - Alpha",
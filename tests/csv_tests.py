@@ -1,9 +1,23 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import os
+import tempfile
 from datetime import datetime
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
 from adaptor.fields import *
+from adaptor import exceptions
 from adaptor.model import CsvModel, CsvDbModel, ImproperlyConfigured,\
     CsvException, CsvDataException, TabularLayout, SkipRow,\
     GroupedCsvModel, CsvFieldDataException
+from adaptor.readers import split_records, MappedFile, get_compression
+from adaptor.report import ErrorReport
+from adaptor.instrumentation import Instrument, HistogramInstrument, STAGES
+from adaptor.profiling import FieldProfiler
+from adaptor.validators import RegexValidator, BaseValidator
 from tests.test_app.models import *
 
 
@@ -86,6 +100,22 @@ class TestCsvDbForeignInvalid(CsvDbModel):
         dbModel = MyModelWithForeign
 
 
+class TestCsvParallel(CsvModel):
+    nom = CharField()
+    age = IntegerField()
+    taille = FloatField()
+
+    class Meta:
+        delimiter = ";"
+        dbModel = MyModel
+        bulk_size = 50
+
+
+class TestCsvSniffedParallel(CsvModel):
+    nom = CharField()
+    age = IntegerField()
+
+
 class TestCsvImporter(TestCase):
     def test_has_delimiter(self):
         self.assertTrue(TestCsvModel.has_class_delimiter())
@@ -95,6 +125,43 @@ class TestCsvImporter(TestCase):
         self.assertFalse(TestCsvModel.is_db_model())
         self.assertTrue(TestCsvDBModel.is_db_model())
 
+    def test_schema_is_compiled_once(self):
+        schema = TestCsvModel.get_schema()
+        self.assertTrue(TestCsvModel.get_schema() is schema)
+        self.assertEquals([entry.name for entry in schema.entries], ['nom', 'age', 'taille'])
+        self.assertEquals([entry.field.position for entry in schema.entries], [0, 1, 2])
+        test = TestCsvModel(data=["Roger", "10", "1.8"])
+        self.assertTrue(test.attrs is schema.fields)
+
+    def test_schema_invalidation(self):
+        class TestCsvSchema(CsvModel):
+            nom = CharField()
+
+        class TestCsvSchemaChild(TestCsvSchema):
+            age = IntegerField()
+
+        child_schema = TestCsvSchemaChild.get_schema()
+        TestCsvSchema.nom = CharField(match="name", row_num=0)
+        self.assertFalse(TestCsvSchemaChild.get_schema() is child_schema)
+        self.assertEquals(TestCsvSchemaChild.get_schema().entries[0].match, "name")
+
+    def test_schema_meta_invalidation(self):
+        class TestCsvDbSchema(CsvDbModel):
+            class Meta:
+                dbModel = MyModel
+                delimiter = ";"
+                exclude = ["taille"]
+
+        self.assertEquals([entry.name for entry in TestCsvDbSchema.get_schema().entries], ["nom", "age"])
+        TestCsvDbSchema.Meta.exclude = ["age"]
+        self.assertEquals([entry.name for entry in TestCsvDbSchema.get_schema().entries], ["nom", "taille"])
+        del TestCsvDbSchema.Meta.exclude
+        self.assertEquals([entry.name for entry in TestCsvDbSchema.get_schema().entries], ["nom", "age", "taille"])
+        TestCsvDbSchema.Meta.dbModel = ComposedKeyForeign
+        self.assertEquals([entry.name for entry in TestCsvDbSchema.get_schema().entries], ["key_1", "key_2"])
+        schema = TestCsvDbSchema.get_schema()
+        self.assertTrue(TestCsvDbSchema.get_schema() is schema)
+
     def test_basic(self):
         test = TestCsvModel(data=TestCsvModel.test_data)
         self.assertEquals(test.nom, 'Roger')
@@ -131,6 +198,21 @@ class TestCsvImporter(TestCase):
             self.assertEquals(line, test[index])
             index += 1
 
+    def test_iter_import_data(self):
+        data = iter(TestCsvMultipleLine.test_data)
+        test = TestCsvMultipleLine.iter_import_data(data=data)
+        line1 = next(test)
+        self.assertEquals(line1.nom, 'Roger')
+        # The second line has not been read yet
+        self.assertEquals(next(data), "Janette;12;1.7")
+        self.assertRaises(StopIteration, next, test)
+
+    def test_iter_import_from_filename(self):
+        test = TestCsvDBModel.iter_import_from_filename("tests/fixtures/csv2.csv")
+        self.assertEquals(MyModel.objects.all().count(), 0)
+        self.assertEquals(len(list(test)), 2)
+        self.assertEquals(MyModel.objects.all().count(), 2)
+
     def test_extra_delimiter(self):
         test = TestCsvMultipleLine.import_data(data=TestCsvMultipleLine.test_data_extra_delimiter)
  
@@ -145,6 +227,146 @@ class TestCsvImporter(TestCase):
         self.assertEquals(line1.age, 10)
         self.assertEquals(line1.taille, 1.8)
 
+    def test_sniff_dialect(self):
+        class TestCsvSniffed(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                sniff_size = 64
+
+        class Stream(object):
+            """
+            A file which cannot be seeked
+            """
+            def __init__(self, text):
+                self.file = io.StringIO(text)
+                self.read, self.readline = self.file.read, self.file.readline
+
+            def __iter__(self):
+                return iter(self.file)
+
+        text = "nom|age|taille\n" + "".join("'Ro|%s'|%d|1.8\n" % ("r" * i, i) for i in range(50))
+        importer = TestCsvSniffed.get_importer(feed="feed")
+        test = importer.import_from_file(Stream(text))
+        self.assertEquals((importer.dialect["delimiter"], importer.dialect["quotechar"]), ("|", "'"))
+        self.assertTrue(importer.header_detected)
+        self.assertEquals(len(test), 50)
+        self.assertEquals((test[3].nom, test[3].age), ("Ro|rrr", 3))
+
+        # The dialect of the feed is not sniffed again: no sample is read
+        test = TestCsvSniffed.import_from_file(iter(["'Jojo'|18|1.8\n"]), feed="feed")
+        self.assertEquals((test[0].nom, test[0].age), ("Jojo", 18))
+
+    def test_sniff_dialect_declared_header(self):
+        class TestCsvNoHeader(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+
+            class Meta:
+                has_header = False
+
+        text = "nom;age\n" + "".join("n%d;%d\n" % (i, i) for i in range(20))
+        report = ErrorReport()
+        test = TestCsvNoHeader.import_from_file(io.StringIO(text), error_report=report)
+        self.assertEquals(len(test), 20)
+        self.assertEquals([(error.line, error.value) for error in report], [(1, "age")])
+
+    def test_sniff_dialect_escaped_quotes(self):
+        class TestCsvSniffed(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+
+        # A doubled quote after the sample is still an escaped quote
+        text = "".join('"n%d";%d\n' % (i, i) for i in range(2000)) + '"a ""b"" c";3\n'
+        test = TestCsvSniffed.import_from_file(io.StringIO(text))
+        self.assertEquals((test[-1].nom, test[-1].age), ('a "b" c', 3))
+
+        text = "".join('"n%d";%d\n' % (i, i) for i in range(5)) + '"a \\"b\\" c";3\n'
+        test = TestCsvSniffed.import_from_file(io.StringIO(text))
+        self.assertEquals(test[-1].nom, 'a "b" c')
+
+    def write_parallel_file(self, lines):
+        csv_file = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        self.addCleanup(os.remove, csv_file.name)
+        csv_file.write("\n".join(lines))
+        csv_file.close()
+        return csv_file.name
+
+    def test_split_records(self):
+        filename = self.write_parallel_file(['"Ro\nger";10;1.8'] * 10)
+        ranges = split_records(filename, 4)
+        self.assertEquals(len(ranges), 4)
+        with open(filename, 'rb') as csv_file:
+            content = csv_file.read()
+        for start, end, first_line in ranges:
+            # Never split inside a quoted value
+            self.assertTrue(content[start:end].startswith(b'"Ro'))
+            self.assertEquals(first_line, content[:start].count(b'"Ro'))
+        self.assertEquals(ranges[-1][1], len(content))
+
+    def test_mapped_file(self):
+        filename = self.write_parallel_file(['"Ro\ngér";10;1.8'] * 10)
+        with open(filename, encoding="utf-8", newline='') as csv_file:
+            content = csv_file.read()
+        with MappedFile(filename, encoding="utf-8", block_size=8) as mapped_file:
+            self.assertEquals("".join(mapped_file.lines()), content)
+            self.assertEquals(mapped_file.sample(6), '"Ro\ng')
+            view = mapped_file.view(4, 8)
+            self.assertEquals(bytes(view), "gér".encode("utf-8"))
+            view.release()
+            start, end, first_line = split_records(filename, 2)[1]
+            self.assertEquals([line for line in csv.reader(mapped_file.lines(start, end), delimiter=";")],
+                              [["Ro\ngér", "10", "1.8"]] * 5)
+        self.assertTrue(mapped_file.file.closed)
+
+        filename = self.write_parallel_file([])
+        with MappedFile(filename) as mapped_file:
+            self.assertEquals(list(mapped_file.lines()), [])
+            self.assertEquals(mapped_file.sample(), "")
+
+    def test_compressed_file(self):
+        lines = ["name %d;%d;1.8" % (i, i) for i in range(200)]
+        content = "\n".join(lines).encode()
+        for suffix, compress in [(".gz", gzip.compress), (".bz2", bz2.compress), (".csv", lzma.compress)]:
+            filename = self.write_parallel_file([])
+            compressed_filename = filename + suffix
+            with open(compressed_filename, "wb") as compressed_file:
+                compressed_file.write(compress(content))
+            self.addCleanup(os.remove, compressed_filename)
+            self.assertNotEquals(get_compression(compressed_filename), None)
+            test = TestCsvParallel.import_from_filename(compressed_filename)
+            self.assertEquals([line.age for line in test], list(range(200)))
+            with self.assertRaises(ImproperlyConfigured):
+                TestCsvParallel.import_from_filename(compressed_filename, workers=2)
+        self.assertEquals(get_compression(filename), None)
+
+    def test_parallel_import(self):
+        filename = self.write_parallel_file(["name %d;%d;1.8" % (i, i) for i in range(200)])
+        test = TestCsvParallel.import_from_filename(filename, workers=2)
+        self.assertEquals([line.age for line in test], list(range(200)))
+        self.assertEquals(MyModel.objects.count(), 200)
+        self.assertEquals(test[150].get_object(), MyModel.objects.get(age=150))
+
+    def test_parallel_import_sniffed_quotechar(self):
+        filename = self.write_parallel_file(["'name\n%d';%d" % (i, i) for i in range(200)])
+        test = TestCsvSniffedParallel.import_from_filename(filename, workers=2)
+        self.assertEquals([line.age for line in test], list(range(200)))
+        self.assertEquals(test[10].nom, "name\n10")
+
+    def test_parallel_import_error(self):
+        lines = ["name %d;%d;1.8" % (i, i) for i in range(200)]
+        lines[150] = "name;error;1.8"
+        filename = self.write_parallel_file(lines)
+        try:
+            TestCsvParallel.import_from_filename(filename, workers=2)
+        except CsvDataException as e:
+            self.assertEquals(e.line, 151)
+        else:
+            self.assertTrue(False, "No exception raised")
+        self.assertEquals(MyModel.objects.count(), 150)
+
     def test_db_model(self):
         test = TestCsvDBModel.import_from_filename("tests/fixtures/csv2.csv")
         self.assertEquals(MyModel.objects.all().count(), 2)
@@ -166,6 +388,41 @@ class TestCsvImporter(TestCase):
         self.assertEquals(obj, test[0].get_object())
 
 
+    def test_bulk_create(self):
+        class TestCsvBulk(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                delimiter = ";"
+                dbModel = MyModel
+                bulk_size = 2
+
+        test_data = ["Janette;12;1.7", "Roger;18;1.8", "Gigi;10;1.2"]
+        test = TestCsvBulk.iter_import_data(test_data)
+        first = next(test)
+        # Released once the first batch has been written
+        self.assertEquals(MyModel.objects.count(), 2)
+        self.assertEquals(first.get_object(), MyModel.objects.get(nom="Janette"))
+        self.assertEquals(len(list(test)), 2)
+        self.assertEquals(MyModel.objects.count(), 3)
+
+    def test_bulk_create_error(self):
+        class TestCsvBulk(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                delimiter = ";"
+                dbModel = MyModel
+                bulk_size = 10
+
+        test_data = ["Janette;12;1.7", "Roger;error;1.8"]
+        self.assertRaises(CsvDataException, TestCsvBulk.import_data, test_data)
+        self.assertEquals(MyModel.objects.count(), 1)
+
     def test_db_unmatching_model(self):
         class TestCsvDBUnmatchingModel(CsvModel):
             name = CharField(match='nom')
@@ -296,6 +553,34 @@ class TestCsvImporter(TestCase):
             self.assertTrue(False, "No valueError raised")
 
 
+    def test_error_report(self):
+        rejects = io.StringIO()
+        report = ErrorReport(max_errors=1, rejects=rejects)
+        test = TestCsvModel.import_data(['Roger;10;1.8', 'Roger;error;1.8', '1,error,12', 'Gigi;12;1.2'],
+                                        error_report=report)
+        self.assertEquals([line.nom for line in test], ['Roger', 'Gigi'])
+        self.assertEquals(len(report), 2)
+        self.assertTrue(report.truncated)
+        self.assertEquals(list(report),
+                          [(2, 'age', 'error', "Value 'error' in columns 2 does not match the expected type Integer")])
+        self.assertEquals(rejects.getvalue(), 'Roger;error;1.8\r\n1,error,12\r\n')
+
+    def test_parallel_error_report(self):
+        lines = ["name %d;%d;1.8" % (i, i) for i in range(200)]
+        lines[20] = lines[150] = "name;error;1.8"
+        filename = self.write_parallel_file(lines)
+        report = ErrorReport()
+        test = TestCsvParallel.import_from_filename(filename, workers=2, error_report=report)
+        self.assertEquals(len(test), 198)
+        self.assertEquals([error.line for error in report], [21, 151])
+
+        # The workers spool their rejected lines, which end up in the file order
+        rejects = io.StringIO()
+        report = ErrorReport(max_errors=1, rejects=rejects)
+        test = TestCsvParallel.import_from_filename(filename, workers=2, error_report=report)
+        self.assertEquals((len(test), len(report)), (198, 2))
+        self.assertEquals(rejects.getvalue(), 'name;error;1.8\r\n' * 2)
+
     def test_validator(self):
         class CsvValidator(CsvModel):
             class Meta:
@@ -362,6 +647,10 @@ class TestCsvImporter(TestCase):
         test = CsvTabular.import_data(test_data)
         self.assertEquals(MyModel.objects.all().count(), 6)
 
+        test = list(CsvTabular.iter_import_data(test_data))
+        self.assertEquals(len(test), 6)
+        self.assertEquals(MyModel.objects.all().count(), 12)
+
     def test_prepare(self):
         def upper(name):
             return name.upper()
@@ -432,6 +721,60 @@ class TestCsvImporter(TestCase):
         self.assertEquals(c0, test[0].composed_key_foreign)
         self.assertEquals(c1, test[1].composed_key_foreign)
 
+        report = ErrorReport()
+        test = ComposedForeignKeyCsv.import_data(["1;3"], error_report=report)
+        self.assertEquals([error.field for error in report], ["composed_key_foreign"])
+
+    def test_multiple_key_foreign_prefetch(self):
+        class ComposedForeignKeyCsv(CsvModel):
+            key_1 = IntegerField()
+            key_2 = IntegerField()
+            composed_key_foreign = ComposedKeyField(ComposedKeyForeign, keys=["key_1", "key_2"], prefetch=10)
+
+            class Meta:
+                delimiter = ";"
+                dbModel = ComposedKey
+
+        c0 = ComposedKeyForeign.objects.create(key_1=1, key_2=1)
+        c1 = ComposedKeyForeign.objects.create(key_1=1, key_2=2)
+        test_data = ["1;1", "1;2", "1;1", "1;2"]
+        with self.assertNumQueries(1 + 4):
+            test = ComposedForeignKeyCsv.import_data(test_data)
+        self.assertEquals([line.composed_key_foreign for line in test], [c0, c1, c0, c1])
+        self.assertRaises(CsvFieldDataException, ComposedForeignKeyCsv.import_data, ["1;3"])
+
+    def test_multiple_key_foreign_prefetch_raw_keys(self):
+        class ComposedForeignKeyCsv(CsvModel):
+            key_1 = CharField()
+            key_2 = CharField()
+            composed_key_foreign = ComposedKeyField(ComposedKeyForeign, keys=["key_1", "key_2"], prefetch=10)
+
+            class Meta:
+                delimiter = ";"
+                dbModel = ComposedKey
+
+        c0 = ComposedKeyForeign.objects.create(key_1=1, key_2=1)
+        c1 = ComposedKeyForeign.objects.create(key_1=1, key_2=2)
+        # The keys, strings here, are compared to the integers of the database
+        with self.assertNumQueries(1 + 3):
+            test = ComposedForeignKeyCsv.import_data(["1;1", "1;2", "1;1"])
+        self.assertEquals([line.composed_key_foreign for line in test], [c0, c1, c0])
+        self.assertRaises(CsvFieldDataException, ComposedForeignKeyCsv.import_data, ["1;3"])
+
+    def test_multiple_key_foreign_large_prefetch(self):
+        class ComposedForeignKeyCsv(CsvModel):
+            key_1 = IntegerField()
+            key_2 = IntegerField()
+            composed_key_foreign = ComposedKeyField(ComposedKeyForeign, keys=["key_1", "key_2"], prefetch=1500)
+
+            class Meta:
+                delimiter = ";"
+                dbModel = ComposedKey
+
+        ComposedKeyForeign.objects.bulk_create([ComposedKeyForeign(key_1=i, key_2=i) for i in range(1500)])
+        test = ComposedForeignKeyCsv.import_data(["%d;%d" % (i, i) for i in range(1500)])
+        self.assertEquals([line.composed_key_foreign.key_1 for line in test], list(range(1500)))
+
     def test_update(self):
         class TestUpdateCsv(CsvModel):
             nom = CharField()
@@ -469,6 +812,99 @@ class TestCsvImporter(TestCase):
         self.assertEquals(MyModelBis.objects.all()[0].poids, 2.0)
 
 
+    def test_bulk_update(self):
+        class TestBulkUpdateCsv(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+            poids = FloatField()
+
+            class Meta:
+                dbModel = MyModelBis
+                delimiter = ";"
+                update = {'keys': ["nom", "age"], 'update': ['poids']}
+                bulk_size = 10
+
+        MyModelBis.objects.create(nom="Roger", age=18, taille=1.8, poids=1.0)
+        test_data = ["Janette;12;1.0;1.0", "Janette;12;2.0;2.0", "Roger;18;2.0;3.0"]
+        with self.assertNumQueries(5):
+            # SAVEPOINT, SELECT, INSERT, UPDATE, RELEASE
+            test = TestBulkUpdateCsv.import_data(test_data)
+        self.assertEquals(MyModelBis.objects.count(), 2)
+        janette = MyModelBis.objects.get(nom="Janette")
+        self.assertEquals((janette.taille, janette.poids), (1.0, 2.0))
+        roger = MyModelBis.objects.get(nom="Roger")
+        self.assertEquals((roger.taille, roger.poids), (1.8, 3.0))
+        self.assertEquals(test[1].get_object(), janette)
+        self.assertEquals(test[2].get_object(), roger)
+
+    def test_bulk_update_large_batch(self):
+        class TestBulkUpdateCsv(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+            poids = FloatField()
+
+            class Meta:
+                dbModel = MyModelBis
+                delimiter = ";"
+                update = {'keys': ["nom", "age"], 'update': ['poids']}
+                bulk_size = 1500
+
+        class TestBulkUpdateSingleKeyCsv(TestBulkUpdateCsv):
+            class Meta(TestBulkUpdateCsv.Meta):
+                update = {'keys': ["nom"], 'update': ['poids']}
+
+        MyModelBis.objects.bulk_create([MyModelBis(nom="name %d" % i, age=i, taille=1.8, poids=1.0)
+                                        for i in range(0, 1500, 2)])
+        TestBulkUpdateCsv.import_data(["name %d;%d;1.0;2.0" % (i, i) for i in range(1500)])
+        self.assertEquals(MyModelBis.objects.count(), 1500)
+        self.assertEquals(MyModelBis.objects.filter(poids=2.0).count(), 1500)
+        TestBulkUpdateSingleKeyCsv.import_data(["name %d;%d;1.0;3.0" % (i, i) for i in range(1500)])
+        self.assertEquals(MyModelBis.objects.count(), 1500)
+        self.assertEquals(MyModelBis.objects.filter(poids=3.0).count(), 1500)
+
+    def test_bulk_update_null_key(self):
+        class TestBulkUpdateCsv(CsvModel):
+            code = IntegerField(null=True)
+            other = IntegerField(null=True)
+            value = IntegerField()
+
+            class Meta:
+                dbModel = NullableKeyModel
+                delimiter = ";"
+                update = {'keys': ["code", "other"]}
+                bulk_size = 10
+
+        class TestBulkUpdateSingleKeyCsv(TestBulkUpdateCsv):
+            class Meta(TestBulkUpdateCsv.Meta):
+                update = {'keys': ["code"]}
+
+        NullableKeyModel.objects.create(code=None, other=None, value=1)
+        NullableKeyModel.objects.create(code=1, other=None, value=1)
+        TestBulkUpdateCsv.import_data([";;2", "1;;2"])
+        self.assertEquals(sorted(NullableKeyModel.objects.values_list("code", "value"), key=str),
+                          [(1, 2), (None, 2)])
+        TestBulkUpdateSingleKeyCsv.import_data([";;3", "1;;3"])
+        self.assertEquals(sorted(NullableKeyModel.objects.values_list("code", "value"), key=str),
+                          [(1, 3), (None, 3)])
+
+    def test_bulk_update_not_unique(self):
+        class TestBulkUpdateCsv(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                dbModel = MyModel
+                delimiter = ";"
+                update = {'keys': ["nom"]}
+                bulk_size = 10
+
+        MyModel.objects.create(nom="Roger", age=18, taille=1.8)
+        MyModel.objects.create(nom="Roger", age=19, taille=1.8)
+        self.assertRaises(ImproperlyConfigured, TestBulkUpdateCsv.import_data, ["Roger;10;1.0"])
+
     def test_update_and_extra(self):
         class TestUpdateOnlyExtraCsv(CsvModel):
             nom = CharField()
@@ -553,6 +989,33 @@ class TestGroupCsv(TestCase):
         self.assertEquals(LastNameModel.objects.count(), 1)
         self.assertEquals(LastNameModel.objects.all()[0].last_name, "lafrite")
 
+    def test_iter_group(self):
+        class TestCsv1(CsvModel):
+            first_name = CharField()
+
+            class Meta:
+                dbModel = FirstNameModel
+
+        class TestCsv2(CsvModel):
+            last_name = CharField()
+
+            class Meta:
+                dbModel = LastNameModel
+
+        class TestGroupedCsv(GroupedCsvModel):
+            csv_models = [TestCsv1, TestCsv2]
+
+            class Meta:
+                delimiter = ";"
+
+        test = TestGroupedCsv.iter_import_data(["jojo;lafrite", "gigi;lafrite"])
+        first, last = next(test), next(test)
+        self.assertEquals(first.first_name, "jojo")
+        self.assertEquals(last.last_name, "lafrite")
+        self.assertEquals(FirstNameModel.objects.count(), 1)
+        self.assertEquals(len(list(test)), 2)
+        self.assertEquals(FirstNameModel.objects.count(), 2)
+
 
     def test_extra_group(self):
         class TestCsvFirstName(CsvModel):
@@ -587,6 +1050,84 @@ class TestGroupCsv(TestCase):
         self.assertEquals(LastNameModelWithForeign.objects.count(), 1)
         self.assertEquals(LastNameModelWithForeign.objects.all()[0].last_name, "lafrite")
 
+    def test_bulk_extra_group(self):
+        class TestCsvFirstName(CsvModel):
+            first_name = CharField()
+
+            class Meta:
+                dbModel = FirstNameModel
+                bulk_size = 10
+
+        class TestCsvLastName(CsvModel):
+            foreign = DjangoModelField(FirstNameModel)
+            last_name = CharField()
+
+            class Meta:
+                dbModel = LastNameModelWithForeign
+                bulk_size = 10
+
+        class TestGroupedCsv(GroupedCsvModel):
+            csv_models = [{"model": TestCsvFirstName, "name": "first"},
+                    {"model": TestCsvLastName, "name": "last",
+                     "use": {"name": "first",
+                             "as": "foreign"}
+                }
+            ]
+
+            class Meta:
+                delimiter = ";"
+
+        test = TestGroupedCsv.import_data(["jojo;lafrite", "gigi;lafrite"])
+        self.assertEquals(len(test), 4)
+        self.assertEquals(LastNameModelWithForeign.objects.count(), 2)
+        self.assertEquals(LastNameModelWithForeign.objects.get(foreign__first_name="gigi").last_name, "lafrite")
+
+    def test_group_error_report(self):
+        class TestCsvFirstName(CsvModel):
+            first_name = CharField()
+
+            class Meta:
+                dbModel = FirstNameModel
+
+        class TestCsvLastName(CsvModel):
+            foreign = DjangoModelField(FirstNameModel)
+            last_name = CharField(choices=["lafrite"])
+
+            class Meta:
+                dbModel = LastNameModelWithForeign
+
+        class TestGroupedCsv(GroupedCsvModel):
+            csv_models = [{"model": TestCsvFirstName, "name": "first"},
+                          {"model": TestCsvLastName, "name": "last", "use": {"name": "first", "as": "foreign"}}]
+
+            class Meta:
+                delimiter = ";"
+
+        class TestBulkCsvFirstName(TestCsvFirstName):
+            class Meta(TestCsvFirstName.Meta):
+                bulk_size = 10
+
+        class TestSimpleGroupedCsv(GroupedCsvModel):
+            csv_models = [TestBulkCsvFirstName, TestCsvModel]
+
+            class Meta:
+                delimiter = ";"
+
+        # The first model of a rejected line is neither written nor returned
+        report = ErrorReport()
+        test = TestGroupedCsv.import_data(["jojo;lafrite", "gigi;error", "toto;lafrite"], error_report=report)
+        self.assertEquals(len(report), 1)
+        self.assertEquals([getattr(line, "first_name", None) for line in test], ["jojo", None, "toto", None])
+        self.assertEquals(sorted(FirstNameModel.objects.values_list("first_name", flat=True)), ["jojo", "toto"])
+        self.assertEquals(LastNameModelWithForeign.objects.count(), 2)
+
+        FirstNameModel.objects.all().delete()
+        report = ErrorReport()
+        test = TestSimpleGroupedCsv.import_data(["jojo;Roger;10;1.8", "gigi;Roger;error;1.8"], error_report=report)
+        self.assertEquals((len(test), len(report)), (2, 1))
+        self.assertEquals(list(FirstNameModel.objects.values_list("first_name", flat=True)), ["jojo"])
+
+
 
 class TestFields(TestCase):
     def test_foreign_key(self):
@@ -612,10 +1153,61 @@ class TestFields(TestCase):
             self.assertTrue(False, "No exception raised")
         self.assertEquals(field.to_python(myModel2.other_pk), myModel2)
 
+    def test_foreign_key_cache(self):
+        field = DjangoModelField(MyModel2, pk="other_pk", cache_size=1)
+        myModel2 = MyModel2.objects.create(other_pk=10)
+        other = MyModel2.objects.create(other_pk=11)
+        with self.assertNumQueries(1):
+            self.assertEquals(field.to_python("10"), myModel2)
+            self.assertEquals(field.to_python("10"), myModel2)
+        with self.assertNumQueries(3):
+            self.assertEquals(field.to_python("11"), other)
+            self.assertEquals(field.to_python("10"), myModel2)
+            self.assertRaises(exceptions.ForeignKeyFieldError, field.to_python, "12")
+            self.assertRaises(exceptions.ForeignKeyFieldError, field.to_python, "12")
+
+    def test_foreign_key_prefetch(self):
+        class TestCsvDbForeign(CsvModel):
+            foreign = DjangoModelField(MyModel, pk="nom", prefetch=10)
+
+            class Meta:
+                dbModel = MyModelWithForeign
+                delimiter = ","
+
+        gigi = MyModel.objects.create(nom="Gigi", age=10, taille=1.2)
+        jojo = MyModel.objects.create(nom="Jojo", age=10, taille=1.2)
+        with self.assertNumQueries(1 + 4):
+            test = TestCsvDbForeign.import_data(["Gigi", "Jojo", "Gigi", "Jojo"])
+        self.assertEquals([line.foreign for line in test], [gigi, jojo, gigi, jojo])
+
+        MyModel.objects.create(nom="Gigi", age=11, taille=1.2)
+        try:
+            TestCsvDbForeign.import_data(["Jojo", "Gigi"])
+        except CsvFieldDataException as e:
+            self.assertEquals(str(e), u'Line 2: Multiple match found for MyModel')
+        else:
+            self.assertTrue(False, "No exception raised")
+
     def test_date_field(self):
         field = DateField(format="%d/%m/%Y")
         self.assertEquals(field.to_python("22/05/2012"), datetime(2012, 0o5, 22))
 
+    def test_date_field_fast_path(self):
+        field = DateField(format="%Y-%m-%dT%H:%M:%S", cache_size=2)
+        self.assertNotEquals(field.parser, None)
+        self.assertEquals(DateField(format="%d %b %Y").parser, None)
+        self.assertEquals(field.to_python("2012-05-22T10:11:12"), datetime(2012, 5, 22, 10, 11, 12))
+        self.assertEquals(field.to_python("2012-05-22T10:11:12"), datetime(2012, 5, 22, 10, 11, 12))
+        self.assertEquals(len(field.cache), 1)
+        # Not fixed width, parsed by strptime
+        self.assertEquals(DateField().to_python("2/5/2012"), datetime(2012, 5, 2))
+        for value in ("31/02/2012", "22/05/12", "2a/05/2012", "22-05-2012"):
+            with self.assertRaises(ValueError) as fast:
+                DateField().to_python(value)
+            with self.assertRaises(ValueError) as strptime:
+                datetime.strptime(value, "%d/%m/%Y")
+            self.assertEquals(str(fast.exception), str(strptime.exception))
+
     def test_decimal_field(self):
         field = DecimalField()
         self.assertEquals(field.to_python("2030"), Decimal("2030"))
@@ -657,6 +1249,211 @@ class TestImporter(TestCase):
         self.assertEquals(test[0].extra_value, "extra")
         self.assertEquals(test[1].extra_value, "extra")
 
+    def test_instrument(self):
+        class TestCsvInstrumented(CsvModel):
+            nom = IgnoredField()
+            foreign = DjangoModelField(MyModel)
+
+            class Meta:
+                delimiter = ";"
+                dbModel = MyModelWithForeign
+
+        class Recorder(Instrument):
+            def __init__(self):
+                super(Recorder, self).__init__(every=2)
+                self.batches = []
+
+            def batch(self, progress):
+                self.batches.append((progress.rows, progress.errors))
+
+            def finish(self, progress):
+                self.progress = progress
+
+        foreign = MyModel.objects.create(nom="jojo", age=12, taille=1.8)
+        data = ["jojo;%d" % foreign.pk] * 4 + ["jojo;0"]
+        recorder = Recorder()
+        report = ErrorReport()
+        TestCsvInstrumented.import_data(data, instrument=recorder, error_report=report)
+        self.assertEquals(recorder.batches, [(2, 0), (4, 0)])
+        self.assertEquals((recorder.progress.rows, recorder.progress.errors), (5, 1))
+        self.assertEquals(recorder.progress.characters, sum(len(line) for line in data))
+        for stage in STAGES:
+            self.assertTrue(recorder.progress.timings[stage] > 0, stage)
+        self.assertTrue(sum(recorder.progress.timings.values()) <= recorder.progress.elapsed)
+
+        histogram = HistogramInstrument(every=2)
+        TestCsvInstrumented.import_data(data[:4], instrument=histogram)
+        self.assertEquals(sum(histogram.histogram.values()), 2)
+        self.assertTrue(histogram.report().startswith("4 rows in"))
+
+    def test_profile(self):
+        class TestCsvProfiled(CsvModel):
+            nom = CharField(prepare=lambda value: value.strip(), choices=["Jojo", "Gigi"],
+                            validator=RegexValidator("NameValidator", r"^[A-Z]"))
+            age = IntegerField()
+            taille = FloatField(transform=lambda value: value * 100)
+
+            class Meta:
+                delimiter = ";"
+
+        profiler = FieldProfiler()
+        report = ErrorReport()
+        test = TestCsvProfiled.import_data([" Jojo ;12;1.8", "Toto;13;1.7", "Gigi;x;1.6"],
+                                           profile=profiler, error_report=report)
+        self.assertEquals([line.taille for line in test], [180.0])
+        stats = profiler.stats
+        self.assertEquals((stats["TestCsvProfiled.nom", "prepare"].calls,
+                           stats["TestCsvProfiled.nom", "choices"].failures), (3, 1))
+        self.assertEquals(stats["TestCsvProfiled.nom", "validator"].calls, 2)
+        self.assertEquals((stats["TestCsvProfiled.age", "to_python"].calls,
+                           stats["TestCsvProfiled.age", "to_python"].failures), (2, 1))
+        self.assertEquals(stats["TestCsvProfiled.taille", "transform"].calls, 1)
+        self.assertTrue("TestCsvProfiled.age" in profiler.report())
+        # The fields are restored after the import
+        field = TestCsvProfiled.get_schema().fields[0][1]
+        self.assertFalse("to_python" in field.__dict__ or "get_transform_method" in field.__dict__)
+        self.assertEquals(len(TestCsvProfiled.import_data(["Jojo;1;1"])), 1)
+
+    def test_profile_db_model(self):
+        class TestCsvDbProfiled(CsvDbModel):
+            class Meta:
+                dbModel = MyModel
+                delimiter = ";"
+
+        profiler = FieldProfiler()
+        test = TestCsvDbProfiled.import_data(["Jojo;12;1.8"], profile=profiler)
+        self.assertEquals(len(test), 1)
+        # The Django fields are neither profiled nor changed
+        self.assertEquals(profiler.stats, {})
+        self.assertFalse("to_python" in MyModel._meta.get_field("age").__dict__)
+
+
+class TestPipeline(TransactionTestCase):
+    """
+    The database is written from another thread, which only sees committed data
+    """
+    def test_pipeline(self):
+        class TestCsvPipeline(CsvModel):
+            foreign = DjangoModelField(MyModel, prefetch=10)
+
+            class Meta:
+                dbModel = MyModelWithForeign
+                delimiter = ";"
+                bulk_size = 7
+
+        my_models = [MyModel.objects.create(nom="name %d" % i, age=i, taille=1.8) for i in range(5)]
+        data = ["%d" % my_models[i % 5].id for i in range(250)]
+        test = TestCsvPipeline.import_data(data, pipeline=True)
+        self.assertEquals([line.foreign for line in test], [my_models[i % 5] for i in range(250)])
+        self.assertEquals(MyModelWithForeign.objects.count(), 250)
+        self.assertEquals(test[249].get_object(), MyModelWithForeign.objects.order_by("id").last())
+
+    def test_pipeline_error(self):
+        lines = ["name %d;%d;1.8" % (i, i) for i in range(250)]
+        lines[150] = "name;error;1.8"
+        try:
+            TestCsvParallel.import_data(lines, pipeline=True)
+        except CsvDataException as e:
+            self.assertEquals(e.line, 151)
+        else:
+            self.assertTrue(False, "No exception raised")
+        self.assertEquals(MyModel.objects.count(), 150)
+
+        MyModel.objects.all().delete()
+        report = ErrorReport()
+        test = TestCsvParallel.import_data(lines, pipeline=True, error_report=report)
+        self.assertEquals(len(test), 249)
+        self.assertEquals([error.line for error in report], [151])
+        self.assertEquals(MyModel.objects.count(), 249)
+
+    def test_pipeline_atomic(self):
+        with transaction.atomic():
+            with self.assertRaises(ImproperlyConfigured):
+                TestCsvParallel.import_data(["name;1;1.8"], pipeline=True)
+        self.assertEquals(MyModel.objects.count(), 0)
+
+    def test_pipeline_stopped(self):
+        lines = ["name %d;%d;1.8" % (i, i) for i in range(1000)]
+        rows = TestCsvParallel.iter_import_data(lines, pipeline=True)
+        self.assertEquals(next(rows).age, 0)
+        rows.close()
+        self.assertTrue(MyModel.objects.count() < 1000)
+
+
+class TestColumns(TestCase):
+    class TestCsvColumns(CsvModel):
+        age = IntegerField()
+        taille = FloatField(null=True, default="0.5")
+        valid = BooleanField()
+        date = DateField()
+
+        class Meta:
+            delimiter = ";"
+
+    def test_import_columns(self):
+        test_data = ["10;1.8;true;22/05/2012", "12;;false;23/05/2012"]
+        columns = self.TestCsvColumns.import_columns(test_data)
+        self.assertEquals(list(columns['age']), [10, 12])
+        # The default is given as it is, as by import_data
+        self.assertEquals(list(columns['taille']), [1.8, "0.5"])
+        self.assertEquals([line.taille for line in self.TestCsvColumns.import_data(test_data)], [1.8, "0.5"])
+        self.assertEquals(list(columns['valid']), [True, False])
+        self.assertEquals(len(columns['date']), 2)
+
+    def test_import_columns_fallback(self):
+        class TestCsvColumnsDefault(CsvModel):
+            age = IntegerField(null=True, default=5)
+            big = IntegerField()
+            note = IntegerField(choices=[1, 2, 3])
+
+            class Meta:
+                delimiter = ";"
+
+        test_data = ["10;%d;1" % 2 ** 70, ";1;3"]
+        columns = TestCsvColumnsDefault.import_columns(test_data)
+        self.assertEquals(list(columns['age']), [10, 5])
+        self.assertEquals(list(columns['big']), [2 ** 70, 1])
+        self.assertEquals(list(columns['note']), [1, 3])
+        try:
+            TestCsvColumnsDefault.import_columns(["10;1;2", "10;1;4"])
+        except CsvDataException as e:
+            self.assertEquals(str(e), u"Line 2: Value '4' does not belong to [1, 2, 3]")
+        else:
+            self.assertTrue(False, "No exception raised")
+
+    def test_import_columns_error(self):
+        test_data = ["10;1.8;true;22/05/2012", "12;1.7;false;23/05/2012", "error;1.7;false;23/05/2012"]
+        try:
+            self.TestCsvColumns.import_columns(test_data)
+        except CsvDataException as e:
+            self.assertEquals(str(e), u"Line 3: Value 'error' in columns 1 does not match the expected type Integer")
+        else:
+            self.assertTrue(False, "No exception raised")
+
+    def test_import_columns_validator(self):
+        class EvenValidator(BaseValidator):
+            validation_message = "Odd value"
+
+            def validate(self, value):
+                return value % 2 == 0
+
+        class TestCsvValidated(CsvModel):
+            age = IntegerField(validator=EvenValidator)
+
+            class Meta:
+                delimiter = ";"
+
+        self.assertEquals(list(TestCsvValidated.import_columns(["10", "12"])['age']), [10, 12])
+        try:
+            TestCsvValidated.import_columns(["10", "13"])
+        except CsvDataException as e:
+            self.assertEquals(str(e), u"Line 2: Odd value")
+        else:
+            self.assertTrue(False, "No exception raised")
+
+    def test_import_columns_unsupported(self):
+        self.assertRaises(ImproperlyConfigured, TestCsvModel.import_columns, ["Roger;10;1.8"])
+
 
 class TestExport(TestCase):
     def test_export(self):
@@ -677,3 +1474,201 @@ class TestExport(TestCase):
         self.assertEquals(test.taille, my_obj.taille)
 
         self.assertEquals(test.export(), u"Jojo;18;1.8")
+
+    def test_import_records(self):
+        class TestCsvModel(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                delimiter = ";"
+
+        test = TestCsvModel.import_records(["Jojo;18;1.8", "Gigi;12;1.2"])
+        self.assertEquals(type(test[0]), TestCsvModel.get_record_class())
+        self.assertFalse(hasattr(test[0], "__dict__"))
+        self.assertEquals((test[1].nom, test[1].age, test[1].taille), ("Gigi", 12, 1.2))
+        self.assertEquals(test[0].as_dict(), {'nom': "Jojo", 'age': 18, 'taille': 1.8})
+        self.assertEquals(test[0].export(), u"Jojo;18;1.8")
+        self.assertEquals(test[0], TestCsvModel.import_data(["Jojo;18;1.8"])[0].as_record())
+
+    def test_export_record_quoted(self):
+        class TestCsvModel(CsvModel):
+            nom = CharField()
+            ignored = IgnoredField()
+            age = IntegerField()
+
+            class Meta:
+                delimiter = ";"
+
+        test = TestCsvModel.import_records(['"Jojo; ""the"" first";x;18'])
+        self.assertEquals(test[0].ignored, None)
+        self.assertEquals(test[0].export(), u'"Jojo; ""the"" first";;18')
+        self.assertEquals(TestCsvModel.import_records([test[0].export()])[0].nom, 'Jojo; "the" first')
+
+    def test_export_queryset(self):
+        class TestCsvModel(CsvModel):
+            nom = CharField()
+            ignored = IgnoredField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                delimiter = ";"
+                has_header = True
+
+        class TestCsvForeign(CsvModel):
+            nom = DjangoModelField(MyModel, pk="nom", match="foreign")
+
+        MyModel.objects.create(nom="Jojo", age=18, taille=1.8)
+        MyModel.objects.create(nom="Gigi; the second", age=12, taille=1.2)
+        output = io.StringIO()
+        count = TestCsvModel.export_queryset(MyModel.objects.order_by("age"), output, chunk_size=1)
+        self.assertEquals(count, 2)
+        self.assertEquals(output.getvalue().splitlines(),
+                          ["nom;ignored;age;taille", '"Gigi; the second";;12;1.2', "Jojo;;18;1.8"])
+        test = TestCsvModel.import_data(io.StringIO(output.getvalue()))
+        self.assertEquals([line.nom for line in test], ["Gigi; the second", "Jojo"])
+
+        jojo = MyModel.objects.get(nom="Jojo")
+        MyModelWithForeign.objects.create(foreign=jojo)
+        output = io.StringIO()
+        TestCsvForeign.export_queryset(MyModelWithForeign.objects.all(), output)
+        self.assertEquals(output.getvalue().splitlines(), ["Jojo"])
+
+    def test_export_queryset_dates(self):
+        class TestCsvDated(CsvModel):
+            nom = CharField()
+            date = DateField()
+
+            class Meta:
+                delimiter = ";"
+                dbModel = DatedModel
+
+        DatedModel.objects.create(nom="Jojo", date=datetime(2012, 5, 22))
+        output = io.StringIO()
+        TestCsvDated.export_queryset(DatedModel.objects.all(), output)
+        self.assertEquals(output.getvalue().splitlines(), ["Jojo;22/05/2012"])
+        test = TestCsvDated.import_data(io.StringIO(output.getvalue()))
+        self.assertEquals(test[0].date, datetime(2012, 5, 22))
+
+    def test_export_queryset_composed_key(self):
+        class ComposedForeignKeyCsv(CsvModel):
+            key_1 = IntegerField()
+            key_2 = IntegerField()
+            composed_key_foreign = ComposedKeyField(ComposedKeyForeign, keys=["key_1", "key_2"])
+
+            class Meta:
+                delimiter = ";"
+                dbModel = ComposedKey
+
+        composed = ComposedKeyForeign.objects.create(key_1=1, key_2=2)
+        ComposedKey.objects.create(composed_key_foreign=composed)
+        output = io.StringIO()
+        ComposedForeignKeyCsv.export_queryset(ComposedKey.objects.all(), output)
+        self.assertEquals(output.getvalue().splitlines(), ["1;2"])
+        test = ComposedForeignKeyCsv.import_data(io.StringIO(output.getvalue()))
+        self.assertEquals(test[0].composed_key_foreign, composed)
+
+
+class AsyncBytesStream(object):
+    """
+    An async stream returning the data by small blocks
+    """
+    def __init__(self, data, block_size=7):
+        self.data = io.BytesIO(data)
+        self.block_size = block_size
+
+    async def read(self, size=-1):
+        return self.data.read(min(size, self.block_size))
+
+
+class TestAsyncImport(TestCase):
+    async def test_import_stream(self):
+        class TestCsvModel(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+            taille = FloatField()
+
+            class Meta:
+                delimiter = ";"
+                dbModel = MyModel
+
+        data = 'Jojo;18;1.8\n"Gigi\n; the second";12;1.2\nZozo;14;1.5'.encode("utf-8")
+        test = await TestCsvModel.aimport_stream(AsyncBytesStream(data), chunk_size=2)
+        self.assertEquals([line.nom for line in test], ["Jojo", "Gigi\n; the second", "Zozo"])
+        self.assertEquals(await MyModel.objects.acount(), 3)
+        self.assertEquals(test[1].object, await MyModel.objects.aget(age=12))
+
+    async def test_foreign_key(self):
+        class TestCsvDbForeign(CsvModel):
+            foreign = DjangoModelField(MyModel)
+
+            class Meta:
+                dbModel = MyModelWithForeign
+                delimiter = ","
+
+        my_model = await MyModel.objects.acreate(nom="Gigi", age=10, taille=1.2)
+        data = ("%d\n%d\n" % (my_model.id, my_model.id)).encode("utf-8")
+        test = [line async for line in TestCsvDbForeign.aiter_import_stream(AsyncBytesStream(data))]
+        self.assertEquals([line.foreign for line in test], [my_model, my_model])
+        self.assertEquals(await MyModelWithForeign.objects.acount(), 2)
+
+        report = ErrorReport()
+        data = ("%d\n%d\n" % (my_model.id, my_model.id + 999)).encode("utf-8")
+        test = await TestCsvDbForeign.aimport_stream(AsyncBytesStream(data), error_report=report)
+        self.assertEquals(len(test), 1)
+        self.assertEquals(len(report.errors), 1)
+        self.assertEquals(await MyModelWithForeign.objects.acount(), 3)
+
+    async def test_multiple_foreign_key(self):
+        class TestCsvMultipleForeign(CsvModel):
+            nom = CharField()
+            foreign = DjangoModelField(MyModel, multiple=True)
+
+            class Meta:
+                delimiter = ";"
+
+        gigi = await MyModel.objects.acreate(nom="Gigi", age=10, taille=1.2)
+        jojo = await MyModel.objects.acreate(nom="Jojo", age=12, taille=1.8)
+        data = ("a;%d;%d\n" % (gigi.id, jojo.id)).encode("utf-8")
+        test = await TestCsvMultipleForeign.aimport_stream(AsyncBytesStream(data))
+        self.assertEquals([line.foreign for line in test], [gigi, jojo])
+
+    async def test_own_caches(self):
+        class TestCsvDbForeign(CsvModel):
+            foreign = DjangoModelField(MyModel, prefetch=10)
+
+            class Meta:
+                dbModel = MyModelWithForeign
+                delimiter = ","
+                bulk_size = 5
+
+        my_model = await MyModel.objects.acreate(nom="Gigi", age=10, taille=1.2)
+        data = ("%d\n" % my_model.id * 12).encode("utf-8")
+        writes = []
+        async for line in TestCsvDbForeign.aiter_import_stream(AsyncBytesStream(data), chunk_size=2):
+            writes.append(await MyModelWithForeign.objects.acount())
+        # Written by batches of bulk_size
+        self.assertEquals(writes, [6] * 6 + [12] * 6)
+        # The caches of the fields, shared by the sync imports, are left untouched
+        self.assertEquals(len(TestCsvDbForeign.get_schema().matches["foreign"].field.cache), 0)
+
+    async def test_sniffed_quotechar(self):
+        class TestCsvModel(CsvModel):
+            nom = CharField()
+            age = IntegerField()
+
+        data = "".join("'Jo\njo %d';%d\n" % (i, i) for i in range(5)).encode("utf-8")
+        test = await TestCsvModel.aimport_stream(AsyncBytesStream(data), chunk_size=2)
+        self.assertEquals([line.nom for line in test], ["Jo\njo %d" % i for i in range(5)])
+
+    def test_unsupported(self):
+        class TestCsvTabular(CsvModel):
+            nom = CharField()
+
+            class Meta:
+                delimiter = ";"
+                layout = TabularLayout
+
+        self.assertRaises(ImproperlyConfigured, TestCsvTabular.aiter_import_stream, AsyncBytesStream(b""))
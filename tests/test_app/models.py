@@ -51,4 +51,12 @@ class LastNameModel(models.Model):
     
 class LastNameModelWithForeign(models.Model):
     foreign = models.ForeignKey(FirstNameModel, on_delete=models.CASCADE)
-    last_name = models.CharField(max_length=10)
\ No newline at end of file
+    last_name = models.CharField(max_length=10)
+class DatedModel(models.Model):
+    nom = models.CharField(max_length=15)
+    date = models.DateField()
+
+class NullableKeyModel(models.Model):
+    code = models.IntegerField(null=True)
+    other = models.IntegerField(null=True)
+    value = models.IntegerField()
@@ -1,8 +1,43 @@
 from django.test import TestCase
-from adaptor.validators import RegexValidator
+from adaptor.fields import CharField
+from adaptor.validators import RegexValidator, GenericRegexValidator, validate_many
+from adaptor import exceptions
 
 class TestValidator(TestCase):
     def test_regex_validator(self):
         validator = RegexValidator("status", "^Z[0,2]")
         self.assertTrue(validator().validate("Z0"))
         self.assertFalse(validator().validate("Z1"))
+
+    def test_regex_validator_compiled(self):
+        validator = RegexValidator("status", "^Z[0,2]")
+        self.assertEquals(validator.pattern.pattern, "^Z[0,2]")
+        self.assertEquals(validator().validate_many(["Z0", "Z1", "Z2"]), [True, False, True])
+
+        class Plain(object):
+            def validate(self, value):
+                return value == "Z1"
+
+        self.assertEquals(validate_many(Plain(), ["Z0", "Z1"]), [False, True])
+
+    def test_regex_validator_set_later(self):
+        class StatusValidator(GenericRegexValidator):
+            pass
+
+        validator = StatusValidator()
+        validator.regex = "^Z[0,2]"
+        self.assertEquals(validator.validate_many(["Z0", "Z1"]), [True, False])
+        self.assertEquals(StatusValidator.pattern, None)
+
+        StatusValidator.regex = "^A"
+        self.assertTrue(StatusValidator().validate("AZ"))
+        StatusValidator.regex = "^B"
+        self.assertEquals(StatusValidator().validate_many(["AZ", "BZ"]), [False, True])
+
+    def test_field_validator(self):
+        field = CharField(validator=RegexValidator("status", "^Z[0,2]"))
+        self.assertEquals(field.get_prep_value("Z0"), "Z0")
+        self.assertTrue(field.get_validator() is field.get_validator())
+        with self.assertRaises(exceptions.FieldError) as error:
+            field.get_prep_value("Z1")
+        self.assertEquals(str(error.exception), "The value does not match the expected pattern")
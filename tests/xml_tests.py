@@ -7,6 +7,22 @@ from adaptor import exceptions
 from tests.test_app.models import *
 
 
+class TestXMLParallelInfo(XMLModel):
+    root = XMLRootField(path="info")
+    age = XMLIntegerField(path="age")
+
+
+class TestXMLParallel(XMLModel):
+    root = XMLRootField(path="person")
+    name = XMLCharField(path="name")
+    age = XMLIntegerField(path="age")
+    info = XMLEmbed(TestXMLParallelInfo)
+    foreign = XMLDjangoModelField(MyModel, path="foreign")
+
+    class Meta:
+        raise_exception = False
+
+
 class TestXMLImporter(TestCase):
 
     def test_extract_xml_data_simplest_case(self):
@@ -154,6 +170,22 @@ class TestXMLImporter(TestCase):
         self.assertEquals(test[0].model, model_object1)
         self.assertEquals(test[1].model, None)
 
+    def test_foreign_field_prefetch(self):
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="person")
+            model = XMLDjangoModelField(MyModel, path="id", prefetch=10)
+
+        xmldata = """<data>
+                        <person><id>%(id)s</id></person>
+                        <person><id>%(id)s</id></person>
+                     </data>"""
+        model_object1 = MyModel.objects.create(nom="Gigi", age=10, taille=1.2)
+        with self.assertNumQueries(1):
+            test = TestXMLModel.import_data(xmldata % {'id': model_object1.id})
+        self.assertEquals(test[1].model, model_object1)
+        self.assertRaises(exceptions.ForeignKeyFieldError,
+                          TestXMLModel.import_data, xmldata % {'id': model_object1.id + 1})
+
     def test_element_values_can_be_transformed(self):
         class TestXMLDoc(XMLModel):
             root = XMLRootField(path="/person")
@@ -280,6 +312,39 @@ class TestXMLImporter(TestCase):
         gigi = test[0]
         self.assertEquals(gigi.name, "gigi")
 
+    def test_paths_are_compiled_once(self):
+        xml = "<data><person><name>jojo</name><age value='12'/></person><name>gigi</name></data>"
+        simple_field = XMLCharField(path="person/name", root=None)
+        attribute_field = XMLIntegerField(path="person/age", attribute="value", root=None)
+        xpath_field = XMLCharField(path="//name", root=None)
+        missing_field = XMLCharField(path="person/size", null=True, default="1.8", root=None)
+        self.assertEquals(simple_field.xpath, None)
+        self.assertNotEquals(xpath_field.xpath, None)
+        self.assertEquals(simple_field.get_prep_value(xml), "jojo")
+        self.assertEquals(attribute_field.get_prep_value(xml), 12)
+        self.assertEquals(xpath_field.get_prep_value(xml), "jojo")
+        self.assertEquals(missing_field.get_prep_value(xml), "1.8")
+
+    def test_document_parsed_once_per_model(self):
+        from adaptor.fields import DocumentCache, parse_document
+
+        class TestInfoXml(XMLModel):
+            root = XMLRootField(path="info")
+            age = XMLIntegerField(path="age")
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="person")
+            name = XMLCharField(path="name")
+            info = XMLEmbed(TestInfoXml)
+
+        xml = "<person><name>jojo</name><info><age>12</age></info></person>"
+        with DocumentCache():
+            self.assertTrue(parse_document(xml) is parse_document(xml))
+        self.assertFalse(parse_document(xml) is parse_document(xml))
+        test = TestXMLModel(xml)
+        self.assertEquals(test.name, "jojo")
+        self.assertEquals(test.info[0].age, 12)
+
     def test_multiple_calls(self):
         class TestXMLModel(XMLModel):
             root = XMLRootField(path="persons")
@@ -438,3 +503,175 @@ class TestXMLImporter(TestCase):
         jojo = test[0]
         self.assertEquals(jojo.first_name, "Jojo")
         self.assertEquals(jojo.last_name, "Gigi")
+
+    def test_import_from_file_streams_elements(self):
+        from io import BytesIO
+
+        class TestInfoXml(XMLModel):
+            root = XMLRootField(path="info")
+            age = XMLIntegerField(path="age")
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="list/person")
+            name = XMLCharField(path="name")
+            age = XMLIntegerField(path="age")
+            info = XMLEmbed(TestInfoXml)
+
+        xmldata = b"""<data>
+                        <person><name>Nobody</name><age>1</age></person>
+                        <list>
+                            <person><name>Jojo</name><age>14</age><info><age>15</age></info></person>
+                            <person><name>Gigi</name><age>12</age></person>
+                            <person><name>Toto</name><age>10</age></person>
+                        </list>
+                     </data>"""
+        test = TestXMLModel.import_from_file(BytesIO(xmldata))
+        self.assertEquals([(person.name, person.age) for person in test],
+                          [("Jojo", 14), ("Gigi", 12), ("Toto", 10)])
+        self.assertEquals(test[0].info[0].age, 15)
+        # The elements already processed are cleared and removed from the tree
+        self.assertEquals(len(test[0]._base_root), 0)
+        self.assertEquals(test[0]._base_root.getparent(), None)
+        self.assertEquals(len(test[2]._base_root.getparent()), 1)
+
+    def test_import_from_file_namespaced_root(self):
+        from io import BytesIO
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="/data/p:person", namespaces={'p': "http://example.com/p"})
+            name = XMLCharField(path="p:name", namespaces={'p': "http://example.com/p"})
+
+        xmldata = b"""<data xmlns:p="http://example.com/p">
+                        <p:person><p:name>Jojo</p:name></p:person>
+                        <person><p:name>Gigi</p:name></person>
+                     </data>"""
+        test = TestXMLModel.import_from_file(BytesIO(xmldata))
+        self.assertEquals([person.name for person in test], ["Jojo"])
+
+    def test_import_from_file_unsupported_root(self):
+        from io import BytesIO
+        from adaptor.model import ImproperlyConfigured
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="//person[age > 12]")
+            name = XMLCharField(path="name")
+
+        with self.assertRaises(ImproperlyConfigured):
+            TestXMLModel.import_from_file(BytesIO(b"<data><person><name>Jojo</name></person></data>"))
+
+        # A descendant axis is not streamed either
+        for path in ("//person", "data//person"):
+            class TestXMLModel(XMLModel):
+                root = XMLRootField(path=path)
+                name = XMLCharField(path="name")
+
+            with self.assertRaises(ImproperlyConfigured):
+                TestXMLModel.import_from_file(BytesIO(b"<data><person><name>Jojo</name></person></data>"))
+
+    def test_import_from_compressed_filename(self):
+        import lzma
+        import os
+        import tempfile
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="person")
+            name = XMLCharField(path="name")
+
+        xml_file = tempfile.NamedTemporaryFile(suffix=".xml.xz", delete=False)
+        self.addCleanup(os.remove, xml_file.name)
+        xml_file.write(lzma.compress(b"<data><person><name>Jojo</name></person>"
+                                     b"<person><name>Gigi</name></person></data>"))
+        xml_file.close()
+        test = TestXMLModel.import_from_filename(xml_file.name)
+        self.assertEquals([person.name for person in test], ["Jojo", "Gigi"])
+
+    def test_parallel_import(self):
+        from io import BytesIO
+        foreign = MyModel.objects.create(nom="jojo", age=12, taille=1.8)
+        persons = ["<person><name>name %d</name><age>%d</age><info><age>%d</age></info>"
+                   "<foreign>%d</foreign></person>" % (i, i, i + 1, foreign.pk) for i in range(200)]
+        persons[150] = "<person><name>error</name><age>error</age><foreign>0</foreign></person>"
+        xmldata = "<data>%s</data>" % "".join(persons)
+        for test in (TestXMLParallel.import_data(xmldata, workers=2),
+                     TestXMLParallel.import_from_file(BytesIO(xmldata.encode()), workers=2)):
+            self.assertEquals([person.name for person in test],
+                              ["name %d" % i for i in range(150)] + ["error"] + ["name %d" % i for i in range(151, 200)])
+            self.assertEquals(test[10].info[0].age, 11)
+            self.assertEquals(test[10].foreign, foreign)
+            self.assertEquals(test[0].errors, [])
+            self.assertEquals([field_name for field_name, message in test[150].errors], ["age", "foreign"])
+
+    def test_parallel_import_error(self):
+        from pickle import dumps, loads
+        xmldata = "<data>%s<info><name>error</name></info></data>" % ("<info><age>1</age></info>" * 20)
+        self.assertRaises(exceptions.FieldValueMissing, TestXMLParallelInfo.import_data, xmldata, workers=2)
+        error = loads(dumps(exceptions.FieldValueMissing("age")))
+        self.assertEquals(str(error), "No value found for field age")
+        error = loads(dumps(exceptions.ForeignKeyFieldError("No match found for MyModel", "MyModel", "1")))
+        self.assertEquals((error.msg, error.model, error.value), ("No match found for MyModel", "MyModel", "1"))
+
+    def test_parallel_import_outer_path(self):
+        from adaptor.model import ImproperlyConfigured
+
+        class TestInfoXml(XMLModel):
+            root = XMLRootField(path="info")
+            name = XMLCharField(path="../name")
+
+        xmldata = "<catalog><person><name>Jojo</name><info/></person></catalog>"
+        for path in ("/catalog/person/name", "../person/name", "ancestor::catalog/person/name"):
+            class TestXMLModel(XMLModel):
+                root = XMLRootField(path="person")
+                name = XMLCharField(path=path)
+
+            self.assertEquals(len(TestXMLModel.import_data(xmldata)), 1)
+            with self.assertRaises(ImproperlyConfigured):
+                TestXMLModel.import_data(xmldata, workers=2)
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="person")
+            info = XMLEmbed(TestInfoXml)
+
+        with self.assertRaises(ImproperlyConfigured):
+            TestXMLModel.import_data(xmldata, workers=2)
+
+    def test_import_records(self):
+        xmldata = "<data><person><name>Jojo</name><age>14</age><info><age>15</age></info>" \
+                  "<foreign>0</foreign></person></data>"
+        test = TestXMLParallel.import_records(xmldata)
+        self.assertEquals(test[0].name, "Jojo")
+        self.assertEquals(test[0].info[0].as_dict(), {'age': 15})
+        self.assertFalse(hasattr(test[0].info[0], "__dict__"))
+        self.assertFalse("root" in test[0].as_dict())
+
+    def test_import_records_optional_embed(self):
+        class TestInfoXml(XMLModel):
+            root = XMLRootField(path="info")
+            age = XMLIntegerField(path="age")
+
+        class TestXMLModel(XMLModel):
+            root = XMLRootField(path="person")
+            name = XMLCharField(path="name")
+            info = XMLEmbed(TestInfoXml)
+
+            def transform_info(self, infos):
+                # The first info, if any
+                return infos[0] if infos else None
+
+        xmldata = "<data><person><name>Jojo</name><info><age>15</age></info></person>" \
+                  "<person><name>Gigi</name></person></data>"
+        test = TestXMLModel.import_records(xmldata)
+        self.assertEquals(test[0].info.age, 15)
+        self.assertEquals((test[1].name, test[1].info), ("Gigi", None))
+
+    def test_instrument(self):
+        from io import BytesIO
+        from adaptor.instrumentation import HistogramInstrument
+
+        xmldata = "<data>%s</data>" % ("<person><name>Jojo</name><age>14</age></person>" * 10)
+        histogram = HistogramInstrument(every=5)
+        test = TestXMLParallel.import_from_file(BytesIO(xmldata.encode()), instrument=histogram)
+        self.assertEquals(len(test), 10)
+        self.assertEquals(histogram.progress.rows, 10)
+        self.assertEquals(histogram.progress.characters, len(xmldata))
+        self.assertTrue(histogram.progress.timings["parse"] > 0)
+        self.assertTrue(histogram.progress.timings["convert"] > 0)